@@ -0,0 +1,255 @@
+# Script: `.\benchmark.py`
+# Note: measures the conversion engine; run with the venv python
+
+# Imports
+import os
+import sys
+import json
+import time
+import random
+import itertools
+import shutil
+import argparse
+import resource
+import platform
+import tempfile
+import subprocess
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BASE_DIR)
+from scripts.temporary import DATA_DIR, NCONVERT_PATH, PILLOW_FORMATS
+
+BENCHMARKS_DIR = os.path.join(DATA_DIR, 'benchmarks')
+FAKE_NCONVERT_PATH = os.path.join(BASE_DIR, 'scripts', 'fake_nconvert.py')
+
+def parse_args(argv=None):
+    """Parse benchmark options."""
+    parser = argparse.ArgumentParser(description="Benchmark the NConvert-Bash conversion engine")
+    parser.add_argument("--nconvert", choices=["fake", "real"], default="fake",
+                        help="Use the bundled fake nconvert or the installed binary")
+    parser.add_argument("--workers", default=f"1,{os.cpu_count() or 1}", help="Comma separated worker counts")
+    parser.add_argument("--batch-sizes", default="1,16", help="Comma separated batch sizes")
+    parser.add_argument("--small-files", type=int, default=400, help="Number of small files (1-64 KB)")
+    parser.add_argument("--huge-files", type=int, default=4, help="Number of huge files")
+    parser.add_argument("--huge-size-mb", type=int, default=32, help="Size of each huge file")
+    parser.add_argument("--formats", default="PSPIMAGE,PNG,TIFF", help="Source formats in the corpus")
+    parser.add_argument("--to", dest="format_to", default="JPEG", help="Comma separated target formats")
+    parser.add_argument("--backends", default="NConvert", help="Comma separated backends (NConvert, Auto)")
+    parser.add_argument("--engines", default="Threads",
+                        help="Comma separated engines (Threads, Asyncio); Asyncio uses the worker count as its in-flight limit")
+    parser.add_argument("--images", action="store_true",
+                        help="Generate decodable images where Pillow can write the format (needed for the Pillow backend)")
+    parser.add_argument("--latency", type=float, default=0.01, help="Fake nconvert seconds per file")
+    parser.add_argument("--latency-per-mb", type=float, default=0.005, help="Fake nconvert seconds per MB")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fake nconvert failure probability")
+    parser.add_argument("--corpus", help="Use an existing corpus folder instead of generating one")
+    parser.add_argument("--output", help="JSON results path (default: data/benchmarks/benchmark_<time>.json)")
+    parser.add_argument("--compare", help="Previous JSON results to compare against")
+    parser.add_argument("--run-config", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def write_image(path, image_format, size, rng):
+    """Write a noise image of roughly size raw bytes with Pillow."""
+    from PIL import Image
+
+    side = max(8, int((size / 3) ** 0.5))
+    Image.frombytes("RGB", (side, side), rng.randbytes(side * side * 3)).save(path, format=image_format)
+
+def generate_corpus(folder, args):
+    """Create a synthetic corpus of many small and a few huge files in mixed formats."""
+    formats = [f.lower() for f in args.formats.split(",")]
+    images = {f for f in formats if args.images and f.upper() in PILLOW_FORMATS}
+    rng = random.Random(1234)
+    for i in range(args.small_files):
+        sub_folder = os.path.join(folder, f"set{i % 8}")
+        os.makedirs(sub_folder, exist_ok=True)
+        path = os.path.join(sub_folder, f"small_{i:05d}.{formats[i % len(formats)]}")
+        if formats[i % len(formats)] in images:
+            write_image(path, formats[i % len(formats)].upper(), rng.randint(1024, 65536), rng)
+            continue
+        with open(path, "wb") as f:
+            f.write(rng.randbytes(rng.randint(1024, 65536)))
+    chunk = rng.randbytes(1048576)
+    for i in range(args.huge_files):
+        path = os.path.join(folder, f"huge_{i:03d}.{formats[i % len(formats)]}")
+        if formats[i % len(formats)] in images:
+            write_image(path, formats[i % len(formats)].upper(), args.huge_size_mb * 1048576, rng)
+            continue
+        with open(path, "wb") as f:
+            for _ in range(args.huge_size_mb):
+                f.write(chunk)
+
+def clean_outputs(folder, format_to):
+    """Remove outputs of a previous run so each run converts everything."""
+    extensions = tuple(f".{target_format.lower()}" for target_format in format_to.split(","))
+    for root, _, filenames in os.walk(folder):
+        for filename in filenames:
+            if filename.lower().endswith(extensions):
+                os.remove(os.path.join(root, filename))
+
+def run_config(config):
+    """Run the engine once in this process and return its measurements."""
+    from scripts import utility
+    from scripts import job_spec
+
+    utility.NCONVERT_PATH = config["nconvert_path"]
+    # Keep learned stats and run logs of benchmark runs out of data/
+    utility.FORMAT_STATS_PATH = os.path.join(config["state_dir"], "format_stats.json")
+    utility.LOGS_DIR = os.path.join(config["state_dir"], "logs")
+    utility.JOURNAL_PATH = os.path.join(config["state_dir"], "journal.sqlite3")
+    spec = job_spec.JobSpec()
+    spec = job_spec.set_folder_location(spec, config["folder"])
+    # All source formats are converted in one scan
+    spec = job_spec.set_format_from(spec, config["formats"])
+    spec = job_spec.set_format_to(spec, config["format_to"])
+    spec = job_spec.set_worker_count(spec, config["workers"])
+    spec = job_spec.set_batch_size(spec, config["batch_size"])
+    spec = job_spec.set_backend(spec, config["backend"])
+    spec = job_spec.set_engine(spec, config["engine"])
+    spec = job_spec.set_async_in_flight(spec, config["workers"])
+    run = utility.ConversionRun(spec)
+
+    self_before = resource.getrusage(resource.RUSAGE_SELF)
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    started = time.perf_counter()
+    for _ in utility.iter_conversion(run):
+        pass
+    # Pillow workers are children too; they are only counted once reaped
+    if utility.PILLOW_POOL:
+        utility.PILLOW_POOL.shutdown()
+    converted = run.done
+    failed = run.failed
+    wall_time = time.perf_counter() - started
+    self_after = resource.getrusage(resource.RUSAGE_SELF)
+    children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    processed = converted + failed
+    return {
+        "workers": config["workers"],
+        "batch_size": config["batch_size"],
+        "backend": config["backend"],
+        "engine": config["engine"],
+        "files": processed,
+        "converted": converted,
+        "failed": failed,
+        "wall_time": wall_time,
+        "files_per_second": processed / wall_time if wall_time else 0.0,
+        "cpu_time_engine": (self_after.ru_utime + self_after.ru_stime) - (self_before.ru_utime + self_before.ru_stime),
+        "cpu_time_nconvert": (children_after.ru_utime + children_after.ru_stime) - (children_before.ru_utime + children_before.ru_stime),
+        "peak_rss_engine_kb": self_after.ru_maxrss,
+        "peak_rss_nconvert_kb": children_after.ru_maxrss
+    }
+
+def run_isolated(config, env):
+    """Run one configuration in a fresh interpreter so peak RSS is not shared between runs."""
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run-config", json.dumps(config)],
+        capture_output=True,
+        text=True,
+        env=env
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or "benchmark run failed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def compare_results(previous_path, results):
+    """Print the speedup of each configuration against a previous run."""
+    with open(previous_path, "r") as f:
+        previous = {(r["workers"], r["batch_size"], r.get("backend", "NConvert"), r.get("engine", "Threads")): r
+                    for r in json.load(f)["results"]}
+    print(f"\nComparison with {previous_path}:")
+    for result in results:
+        before = previous.get((result["workers"], result["batch_size"], result["backend"], result["engine"]))
+        if before and result["wall_time"]:
+            speedup = before["wall_time"] / result["wall_time"]
+            print(f"  workers={result['workers']:<3} batch={result['batch_size']:<4} "
+                  f"backend={result['backend']:<8} engine={result['engine']:<7} {speedup:.2f}x")
+
+def main():
+    args = parse_args()
+    if args.run_config:
+        print(json.dumps(run_config(json.loads(args.run_config))))
+        return
+
+    print("="*80)
+    print("    NConvert-Bash - Benchmark")
+    print("="*80)
+
+    if args.nconvert == "real":
+        nconvert_path = NCONVERT_PATH
+        if not os.access(nconvert_path, os.X_OK):
+            print(f"✗ nconvert not found or not executable at {nconvert_path}")
+            sys.exit(1)
+    else:
+        nconvert_path = FAKE_NCONVERT_PATH
+        os.chmod(nconvert_path, 0o755)
+
+    env = dict(os.environ)
+    env.update({
+        "FAKE_NCONVERT_LATENCY": str(args.latency),
+        "FAKE_NCONVERT_LATENCY_PER_MB": str(args.latency_per_mb),
+        "FAKE_NCONVERT_FAILURE_RATE": str(args.failure_rate)
+    })
+
+    corpus_dir = args.corpus or tempfile.mkdtemp(prefix="nconvert_bench_")
+    state_dir = tempfile.mkdtemp(prefix="nconvert_bench_state_")
+    try:
+        if not args.corpus:
+            print(f"Generating corpus in {corpus_dir}...")
+            generate_corpus(corpus_dir, args)
+
+        results = []
+        configurations = itertools.product(
+            args.engines.split(","),
+            args.backends.split(","),
+            [int(w) for w in args.workers.split(",")],
+            [int(b) for b in args.batch_sizes.split(",")]
+        )
+        for engine, backend, workers, batch_size in configurations:
+            clean_outputs(corpus_dir, args.format_to)
+            config = {
+                "nconvert_path": nconvert_path,
+                "folder": corpus_dir,
+                "formats": args.formats.split(","),
+                "format_to": args.format_to,
+                "workers": workers,
+                "batch_size": batch_size,
+                "backend": backend,
+                "engine": engine,
+                "state_dir": state_dir
+            }
+            result = run_isolated(config, env)
+            results.append(result)
+            print(f"engine={engine:<7} backend={backend:<8} workers={workers:<3} batch={batch_size:<4} "
+                  f"{result['files_per_second']:8.1f} files/s  wall {result['wall_time']:7.2f}s  "
+                  f"cpu {result['cpu_time_engine'] + result['cpu_time_nconvert']:7.2f}s  "
+                  f"rss {result['peak_rss_engine_kb'] // 1024}MB/{result['peak_rss_nconvert_kb'] // 1024}MB")
+        clean_outputs(corpus_dir, args.format_to)
+    finally:
+        shutil.rmtree(state_dir, ignore_errors=True)
+        if not args.corpus:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"cpu_count": os.cpu_count(), "python": platform.python_version(), "platform": platform.platform()},
+        "nconvert": args.nconvert,
+        "corpus": {
+            "small_files": args.small_files, "huge_files": args.huge_files,
+            "huge_size_mb": args.huge_size_mb, "formats": args.formats, "path": args.corpus
+        },
+        "fake_nconvert": {"latency": args.latency, "latency_per_mb": args.latency_per_mb, "failure_rate": args.failure_rate},
+        "format_to": args.format_to,
+        "results": results
+    }
+    output_path = args.output or os.path.join(BENCHMARKS_DIR, f"benchmark_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"✓ Results written to {output_path}")
+
+    if args.compare:
+        compare_results(args.compare, results)
+
+if __name__ == "__main__":
+    main()
@@ -4,9 +4,10 @@
 import os
 import sys
 import socket
+import signal
+import argparse
 import webbrowser
-from threading import Timer
-from scripts.interface import create_gradio_interface
+from threading import Thread, Timer
 
 # Define base and workspace directories
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -31,8 +32,134 @@ def find_available_port(start_port=7860, max_attempts=10):
     print("Error: No available ports found. Please close other applications and try again.")
     sys.exit(1)
 
+def parse_args(argv=None):
+    """Parse command line arguments; no command launches the Gradio interface."""
+    from scripts.temporary import (
+        ALLOWED_FORMATS, FORMATS_FROM, FORMATS_TO, WORKER_COUNT, BATCH_SIZE,
+        INCREMENTAL_MODES, INCREMENTAL_MODE, RETRY_MAX_ATTEMPTS, RETRY_BACKOFF,
+        SCHEDULING_POLICIES, SCHEDULING_POLICY, MEMORY_BUDGET_MB, DELETE_MODES, DELETE_MODE,
+        DISK_RESERVE_MB, CONVERSION_PRESETS, CONVERSION_PRESET, BACKENDS, BACKEND, ENGINES, ENGINE,
+        ASYNC_IN_FLIGHT, PRIORITIES, PRIORITY
+    )
+    parser = argparse.ArgumentParser(description="NConvert-Bash image converter")
+    subparsers = parser.add_subparsers(dest="command")
+    convert_parser = subparsers.add_parser("convert", help="Run a conversion headless, without the Gradio interface")
+    convert_parser.add_argument("--from", dest="format_from", nargs="+", type=str.upper, choices=ALLOWED_FORMATS,
+                                default=FORMATS_FROM, help="Source formats, all converted in one scan")
+    convert_parser.add_argument("--sniff", action="store_true",
+                                help="Identify source files by their content as well as their extension")
+    convert_parser.add_argument("--to", dest="format_to", nargs="+", type=str.upper, choices=ALLOWED_FORMATS,
+                                default=FORMATS_TO, help="Target formats, all written from one decode of each source")
+    convert_parser.add_argument("--preset", choices=list(CONVERSION_PRESETS), default=CONVERSION_PRESET,
+                                help="Named resize/quality/metadata operations applied while converting")
+    convert_parser.add_argument("--backend", choices=BACKENDS, default=BACKEND,
+                                help="Auto converts JPEG/PNG/WEBP/BMP/GIF/TIFF pairs with Pillow in-process")
+    convert_parser.add_argument("--dir", dest="folder", required=True, help="Folder to convert (searched recursively)")
+    convert_parser.add_argument("--jobs", type=int, default=WORKER_COUNT, help="Parallel nconvert workers")
+    convert_parser.add_argument("--engine", choices=ENGINES, default=ENGINE,
+                                help="Asyncio drives all nconvert processes from one event loop instead of a thread each")
+    convert_parser.add_argument("--in-flight", type=int, default=ASYNC_IN_FLIGHT,
+                                help="nconvert processes the asyncio engine runs at once")
+    convert_parser.add_argument("--priority", choices=PRIORITIES, default=PRIORITY,
+                                help="Weight of this job's share of nconvert processes when jobs run concurrently")
+    convert_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Files per nconvert run")
+    convert_parser.add_argument("--incremental", choices=INCREMENTAL_MODES, default=INCREMENTAL_MODE)
+    convert_parser.add_argument("--delete", action="store_true", help="Delete original files after conversion")
+    convert_parser.add_argument("--delete-mode", choices=DELETE_MODES, default=DELETE_MODE,
+                                help="Delete each original once its output is verified, or all after the run")
+    convert_parser.add_argument("--max-attempts", type=int, default=RETRY_MAX_ATTEMPTS, help="Attempts per file")
+    convert_parser.add_argument("--retry-backoff", type=float, default=RETRY_BACKOFF, help="Base retry backoff in seconds")
+    convert_parser.add_argument("--schedule", choices=SCHEDULING_POLICIES, default=SCHEDULING_POLICY, help="Dispatch order")
+    convert_parser.add_argument("--memory-budget-mb", type=int, default=MEMORY_BUDGET_MB,
+                                help="Estimated decode memory allowed across workers (0 disables)")
+    convert_parser.add_argument("--disk-reserve-mb", type=int, default=DISK_RESERVE_MB,
+                                help="Free space to keep on the output filesystem; new files wait for it (0 disables)")
+    convert_parser.add_argument("--dedup", action="store_true",
+                                help="Convert byte-identical files once and link the other outputs")
+    convert_parser.add_argument("--cache", action="store_true",
+                                help="Reuse outputs of earlier identical conversions from data/cache")
+    convert_parser.add_argument("--retry-any-failure", action="store_true", help="Retry failed files, not only timeouts")
+    resume_parser = subparsers.add_parser("resume", help="Resume an interrupted conversion with its original settings")
+    resume_parser.add_argument("--run-id", type=int, help="Journal run to resume (default: the latest interrupted run)")
+    return parser.parse_args(argv)
+
+def stream_conversion(utility, run):
+    """Print a conversion's log as it runs, returning the process exit code."""
+    received = []
+
+    def on_signal(signum, frame):
+        """Cancel the run, so no nconvert process in its own session outlives the CLI."""
+        received.append(signum)
+        # From a thread, as the handler may interrupt code holding the run's locks
+        Thread(target=utility.cancel_conversion, args=(run,)).start()
+
+    # nconvert runs in its own process groups, so Ctrl-C and SIGTERM never reach it directly
+    signal.signal(signal.SIGINT, on_signal)
+    signal.signal(signal.SIGTERM, on_signal)
+    try:
+        for line in utility.iter_conversion(run):
+            sys.stdout.write(line)
+            sys.stdout.flush()
+            if line.startswith("Error:"):
+                return 2
+    except BaseException:
+        utility.cancel_conversion(run)
+        raise
+
+    if received:
+        return 128 + received[0]
+    return 1 if run.failed else 0
+
+def run_cli(args):
+    """Run a headless conversion, returning the process exit code."""
+    from scripts import utility
+    from scripts import job_spec
+
+    if not os.path.isdir(args.folder):
+        print(f"Error: Folder not found: {args.folder}")
+        return 2
+    spec = job_spec.JobSpec()
+    spec = job_spec.set_folder_location(spec, os.path.abspath(args.folder))
+    spec = job_spec.set_format_from(spec, args.format_from)
+    spec = job_spec.set_sniff_formats(spec, args.sniff)
+    spec = job_spec.set_format_to(spec, args.format_to)
+    spec = job_spec.set_preset(spec, args.preset)
+    spec = job_spec.set_backend(spec, args.backend)
+    spec = job_spec.set_worker_count(spec, args.jobs)
+    spec = job_spec.set_engine(spec, args.engine)
+    spec = job_spec.set_async_in_flight(spec, args.in_flight)
+    spec = job_spec.set_priority(spec, args.priority)
+    spec = job_spec.set_batch_size(spec, args.batch_size)
+    spec = job_spec.set_incremental_mode(spec, args.incremental)
+    spec = job_spec.set_delete_files_after(spec, args.delete)
+    spec = job_spec.set_delete_mode(spec, args.delete_mode)
+    spec = job_spec.set_scheduling_policy(spec, args.schedule)
+    spec = job_spec.set_memory_budget(spec, args.memory_budget_mb)
+    spec = job_spec.set_disk_reserve(spec, args.disk_reserve_mb)
+    spec = job_spec.set_deduplicate(spec, args.dedup)
+    spec = job_spec.set_use_cache(spec, args.cache)
+    spec = job_spec.set_retry_policy(spec, args.max_attempts, args.retry_backoff, not args.retry_any_failure)
+    return stream_conversion(utility, utility.ConversionRun(spec))
+
+def run_resume(args):
+    """Resume an interrupted conversion headless, returning the process exit code."""
+    from scripts import utility
+
+    resumable = utility.prepare_resume(args.run_id)
+    if not resumable:
+        print("Error: No interrupted run to resume.")
+        return 2
+    resume_run_id, spec = resumable
+    return stream_conversion(utility, utility.ConversionRun(spec, resume_run_id))
+
 def main():
     """Main entry point for launching the NConvert-Bash program."""
+    args = parse_args()
+    if args.command == "convert":
+        sys.exit(run_cli(args))
+    if args.command == "resume":
+        sys.exit(run_resume(args))
+
     os.system('clear')
     print("="*80)
     print("NConvert-Bash - Main Program")
@@ -57,8 +184,9 @@ def main():
         print(f"Error creating workspace directory: {e}")
         sys.exit(1)
 
-    # Create Gradio interface
+    # Create Gradio interface (gradio is only imported for the GUI)
     try:
+        from scripts.interface import create_gradio_interface
         demo = create_gradio_interface()
     except Exception as e:
         print(f"Error creating Gradio interface: {e}")
@@ -69,16 +197,27 @@ def main():
     url = f"http://localhost:{port}"
     print(f"Starting Gradio interface on {url}")
 
-    # Launch Gradio interface
+    # Serve Gradio from a FastAPI app that also exposes /metrics for Prometheus (both ship with gradio)
     try:
-        demo.launch(
-            server_name="localhost",
-            server_port=port,
-            share=False,
-            inbrowser=False,  # Disable automatic browser opening
-            show_error=True,
-            quiet=False
-        )
+        import gradio as gr
+        import uvicorn
+        from fastapi import FastAPI
+        from fastapi.responses import PlainTextResponse
+        from scripts import utility
+        from scripts.metrics import render_metrics
+
+        app = FastAPI()
+
+        @app.get("/metrics", response_class=PlainTextResponse)
+        def metrics():
+            """Serve conversion counters and live engine gauges in the Prometheus text format."""
+            return PlainTextResponse(render_metrics(utility.SHARED_SCHEDULER), media_type="text/plain; version=0.0.4")
+
+        # Streaming job progress needs the queue
+        demo.queue()
+        app = gr.mount_gradio_app(app, demo, path="/")
+        print(f"Metrics for Prometheus on {url}/metrics")
+        uvicorn.run(app, host="localhost", port=port, log_level="warning")
     except Exception as e:
         print(f"Error launching Gradio interface: {e}")
         print("Please check that the port is available and try again.")
@@ -0,0 +1,119 @@
+# Script: `.\scripts\cache.py`
+# Note: content-addressed store of converted outputs, evicted least recently used first
+
+# Imports
+import os
+import time
+import hashlib
+import threading
+from scripts.temporary import CACHE_DIR, CACHE_MAX_MB
+
+# Cache entries by key: [path, size, last_used]; loaded from disk on first use
+CACHE_ENTRIES = None
+CACHE_BYTES = 0
+CACHE_LOCK = threading.Lock()
+# Counters since the program started; each run also keeps its own
+CACHE_STATS = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0}
+
+def load_cache_index():
+    """Index the cache directory, using modification time as last use."""
+    global CACHE_ENTRIES, CACHE_BYTES
+    CACHE_ENTRIES = {}
+    CACHE_BYTES = 0
+    if not os.path.isdir(CACHE_DIR):
+        return
+    for root, _, filenames in os.walk(CACHE_DIR):
+        for filename in filenames:
+            if filename.endswith(".tmp") or filename.endswith(".link-tmp"):
+                continue
+            path = os.path.join(root, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            key = filename.split(".", 1)[0]
+            CACHE_ENTRIES[key] = [path, stat.st_size, stat.st_mtime]
+            CACHE_BYTES += stat.st_size
+
+def ensure_cache_index():
+    """Load the index if this process has not done so yet."""
+    if CACHE_ENTRIES is None:
+        load_cache_index()
+
+def get_nconvert_id(nconvert_path):
+    """Identify the nconvert build by size and modification time, so upgrades miss the cache."""
+    try:
+        stat = os.stat(nconvert_path)
+        return f"{stat.st_size}-{stat.st_mtime_ns}"
+    except OSError:
+        return "unknown"
+
+def get_cache_key(input_hash, target_format, options, nconvert_id):
+    """Build the key for a converted output from everything that affects it."""
+    material = "\0".join([input_hash, target_format.upper(), " ".join(options), nconvert_id])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+def get_cache_path(key, extension):
+    """Return where the output for key is stored."""
+    return os.path.join(CACHE_DIR, key[:2], f"{key}.{extension}")
+
+def cache_lookup(key):
+    """Return the stored output path for key and mark it used, or None on a miss."""
+    with CACHE_LOCK:
+        ensure_cache_index()
+        entry = CACHE_ENTRIES.get(key)
+        if entry and not os.path.exists(entry[0]):
+            CACHE_ENTRIES.pop(key)
+            entry = None
+        if not entry:
+            CACHE_STATS["misses"] += 1
+            return None
+        CACHE_STATS["hits"] += 1
+        entry[2] = time.time()
+    try:
+        os.utime(entry[0])
+    except OSError:
+        pass
+    return entry[0]
+
+def cache_commit(key, path):
+    """Record an output written to its cache path, then evict down to the size cap."""
+    global CACHE_BYTES
+    size = os.path.getsize(path)
+    with CACHE_LOCK:
+        ensure_cache_index()
+        previous = CACHE_ENTRIES.get(key)
+        if previous:
+            CACHE_BYTES -= previous[1]
+        CACHE_ENTRIES[key] = [path, size, time.time()]
+        CACHE_BYTES += size
+        CACHE_STATS["stored"] += 1
+    evict_cache(CACHE_MAX_MB * 1048576)
+
+def evict_cache(max_bytes):
+    """Delete least recently used outputs until the cache fits max_bytes."""
+    global CACHE_BYTES
+    with CACHE_LOCK:
+        if CACHE_BYTES <= max_bytes:
+            return
+        # Evict a little further than needed so eviction doesn't run on every store
+        target = max_bytes * 0.9
+        for key, (path, size, _) in sorted(CACHE_ENTRIES.items(), key=lambda item: item[1][2]):
+            if CACHE_BYTES <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue
+            del CACHE_ENTRIES[key]
+            CACHE_BYTES -= size
+            CACHE_STATS["evicted"] += 1
+
+def get_cache_summary():
+    """Return hit/miss counters and the cache's current size."""
+    with CACHE_LOCK:
+        lookups = CACHE_STATS["hits"] + CACHE_STATS["misses"]
+        return dict(CACHE_STATS, bytes=CACHE_BYTES, entries=len(CACHE_ENTRIES or {}),
+                    hit_ratio=CACHE_STATS["hits"] / lookups if lookups else 0.0)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# Script: `.\scripts\fake_nconvert.py`
+# Note: stand-in for the nconvert binary, used by benchmark.py
+
+# Imports
+import os
+import sys
+import time
+import random
+
+# Behaviour, configured through the environment
+LATENCY = float(os.environ.get("FAKE_NCONVERT_LATENCY", "0.01"))  # seconds per file
+LATENCY_PER_MB = float(os.environ.get("FAKE_NCONVERT_LATENCY_PER_MB", "0.005"))
+FAILURE_RATE = float(os.environ.get("FAKE_NCONVERT_FAILURE_RATE", "0"))
+BUSY = os.environ.get("FAKE_NCONVERT_BUSY", "1") == "1"  # burn CPU instead of sleeping
+
+# Number of arguments taken by each option; unknown options take none
+OPTION_ARGS = {
+    "-out": 1, "-o": 1, "-l": 1, "-q": 1, "-resize": 2, "-ratio": 0,
+    "-rmeta": 0, "-overwrite": 0, "-quiet": 0, "-c": 1, "-dpi": 1,
+    "-rtype": 1, "-rflag": 1
+}
+
+# Leading bytes written for each output format
+OUTPUT_MAGIC = {
+    "jpeg": b"\xff\xd8\xff\xe0", "jpg": b"\xff\xd8\xff\xe0",
+    "png": b"\x89PNG\r\n\x1a\n", "gif": b"GIF89a", "bmp": b"BM",
+    "tiff": b"II*\x00", "webp": b"RIFF\x00\x00\x00\x00WEBP", "psd": b"8BPS"
+}
+
+def spend(seconds):
+    """Simulate conversion work for the given time."""
+    if not BUSY:
+        time.sleep(seconds)
+        return
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+def main(args):
+    """Parse an nconvert-style command line and write fake outputs."""
+    options = {}
+    inputs = []
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg.startswith("-") and len(arg) > 1:
+            count = OPTION_ARGS.get(arg, 0)
+            options[arg] = args[i + 1:i + 1 + count]
+            i += 1 + count
+        else:
+            inputs.append(arg)
+            i += 1
+    if "-l" in options:
+        with open(options["-l"][0]) as list_file:
+            inputs.extend(line.strip() for line in list_file if line.strip())
+
+    target = options.get("-out", ["jpeg"])[0].lower()
+    template = options.get("-o", [None])[0]
+    failed = 0
+    for input_file in inputs:
+        try:
+            size = os.path.getsize(input_file)
+            spend(LATENCY + LATENCY_PER_MB * size / 1048576)
+            if random.random() < FAILURE_RATE:
+                raise ValueError("simulated decode failure")
+            base_name = os.path.splitext(os.path.basename(input_file))[0]
+            if template:
+                output_file = template.replace("%", base_name)
+            else:
+                output_file = os.path.join(os.path.dirname(input_file), f"{base_name}.{target}")
+            with open(input_file, "rb") as source, open(output_file, "wb") as output:
+                output.write(OUTPUT_MAGIC.get(target, b""))
+                output.write(source.read())
+            print(f"Conversion of {input_file} into {output_file}...OK")
+        except Exception as e:
+            failed += 1
+            sys.stderr.write(f"Error converting {input_file}: {e}\n")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -3,11 +3,29 @@
 # Imports
 import gradio as gr
 import os
-from scripts.temporary import ALLOWED_FORMATS, FOLDER_LOCATION, FORMAT_FROM, FORMAT_TO
-from scripts.utility import (
-    browse_folder, start_conversion, set_folder_location,
-    set_format_from, set_format_to, set_delete_files_after
+import sys
+import time
+from scripts.temporary import (
+    ALLOWED_FORMATS, FOLDER_LOCATION, FORMATS_FROM, FORMATS_TO, WORKER_COUNT,
+    MAX_WORKER_COUNT, BATCH_SIZE, MAX_BATCH_SIZE, INCREMENTAL_MODES,
+    INCREMENTAL_MODE, PROGRESS_UPDATE_INTERVAL, RETRY_MAX_ATTEMPTS, RETRY_BACKOFF,
+    RETRY_ON_TIMEOUT_ONLY, SCHEDULING_POLICIES, SCHEDULING_POLICY, MEMORY_BUDGET_MB,
+    DEDUPLICATE, USE_CACHE, DELETE_MODES, DELETE_MODE, DISK_RESERVE_MB, SNIFF_FORMATS,
+    CONVERSION_PRESETS, CONVERSION_PRESET, BACKENDS, BACKEND, ENGINES, ENGINE,
+    ASYNC_IN_FLIGHT, MAX_ASYNC_IN_FLIGHT, PRIORITIES, PRIORITY
 )
+from scripts.utility import browse_folder, format_duration
+from scripts.job_spec import (
+    JobSpec, set_folder_location,
+    set_format_from, set_format_to, set_delete_files_after, set_worker_count,
+    set_batch_size, set_incremental_mode, set_retry_policy, set_scheduling_policy,
+    set_memory_budget, set_deduplicate, set_use_cache, set_delete_mode, set_disk_reserve,
+    set_sniff_formats, set_preset, set_backend, set_engine, set_async_in_flight, set_priority
+)
+from scripts.jobs import submit_job, get_job_status, list_jobs, cancel_job, cancel_all_jobs
+
+# Columns of the jobs table
+JOB_TABLE_HEADERS = ["Job", "State", "Priority", "Processed", "Queued", "Mean Wait (s)", "Running"]
 
 def print_status(message, success=True):
     """Print a status message with a checkmark or cross."""
@@ -16,32 +34,149 @@ def print_status(message, success=True):
 
 def create_gradio_interface():
     """Create and configure the Gradio interface."""
-    def on_browse_folder():
+    def on_browse_folder(spec):
         """Handle folder browsing."""
-        new_location = browse_folder()
-        set_folder_location(new_location)
-        return new_location
+        new_location = browse_folder(spec.folder_location)
+        return new_location, set_folder_location(spec, new_location)
+
+    def on_folder_location_change(new_location, spec):
+        """Handle folder location typed in."""
+        return set_folder_location(spec, new_location)
+
+    def on_format_from_change(new_formats, spec):
+        """Handle source formats change."""
+        return set_format_from(spec, new_formats)
+
+    def on_sniff_formats_change(should_sniff, spec):
+        """Handle content detection checkbox change."""
+        return set_sniff_formats(spec, should_sniff)
+
+    def on_format_to_change(new_formats, spec):
+        """Handle target formats change."""
+        return set_format_to(spec, new_formats)
 
-    def on_format_from_change(new_format):
-        """Handle source format change."""
-        return set_format_from(new_format)
+    def on_preset_change(new_preset, spec):
+        """Handle preset change."""
+        return set_preset(spec, new_preset)
 
-    def on_format_to_change(new_format):
-        """Handle target format change."""
-        return set_format_to(new_format)
+    def on_backend_change(new_backend, spec):
+        """Handle backend change."""
+        return set_backend(spec, new_backend)
 
-    def on_delete_change(should_delete):
+    def on_engine_change(new_engine, spec):
+        """Handle engine change."""
+        return set_engine(spec, new_engine)
+
+    def on_async_in_flight_change(new_count, spec):
+        """Handle asyncio in-flight limit change."""
+        return set_async_in_flight(spec, new_count)
+
+    def on_priority_change(new_priority, spec):
+        """Handle job priority change."""
+        return set_priority(spec, new_priority)
+
+    def on_delete_change(should_delete, spec):
         """Handle delete checkbox change."""
-        return set_delete_files_after(should_delete)
+        return set_delete_files_after(spec, should_delete)
+
+    def on_delete_mode_change(new_mode, spec):
+        """Handle delete mode change."""
+        return set_delete_mode(spec, new_mode)
+
+    def on_worker_count_change(new_count, spec):
+        """Handle worker count change."""
+        return set_worker_count(spec, new_count)
+
+    def on_batch_size_change(new_size, spec):
+        """Handle batch size change."""
+        return set_batch_size(spec, new_size)
+
+    def on_incremental_mode_change(new_mode, spec):
+        """Handle incremental mode change."""
+        return set_incremental_mode(spec, new_mode)
+
+    def on_retry_policy_change(max_attempts, backoff, timeout_only, spec):
+        """Handle retry policy change."""
+        return set_retry_policy(spec, max_attempts, backoff, timeout_only)
+
+    def on_scheduling_policy_change(new_policy, spec):
+        """Handle scheduling policy change."""
+        return set_scheduling_policy(spec, new_policy)
+
+    def on_memory_budget_change(new_budget_mb, spec):
+        """Handle memory budget change."""
+        return set_memory_budget(spec, new_budget_mb)
+
+    def on_disk_reserve_change(new_reserve_mb, spec):
+        """Handle free space reserve change."""
+        return set_disk_reserve(spec, new_reserve_mb)
+
+    def on_deduplicate_change(should_deduplicate, spec):
+        """Handle duplicate detection checkbox change."""
+        return set_deduplicate(spec, should_deduplicate)
+
+    def on_use_cache_change(should_use_cache, spec):
+        """Handle conversion cache checkbox change."""
+        return set_use_cache(spec, should_use_cache)
+
+    def get_jobs_table():
+        """Return a row per job, newest first, with its queue depth and wait."""
+        return [[status["id"], status["state"], status["priority"], f"{status['processed']}/{status['total']}",
+                 status["queued"], round(status["queue_wait"], 2), status["running"]] for status in list_jobs()]
+
+    def stream_job(job_id, progress):
+        """Poll a background job, yielding coalesced progress until it finishes."""
+        while True:
+            status = get_job_status(job_id)
+            if status is None:
+                yield job_id, f"No job with ID '{job_id}'.", get_jobs_table()
+                return
+            processed, total = status["processed"], status["total"]
+            if total:
+                rate = processed / max(status["elapsed"], 1e-6)
+                if status["scan_complete"]:
+                    eta = (total - processed) / rate if rate else 0
+                    desc = f"{rate:.1f} files/s, ETA {format_duration(eta)}"
+                else:
+                    desc = f"{rate:.1f} files/s, scanning ({total}+ files found)"
+                if status["queued"]:
+                    desc += f", {status['queued']} queued"
+                progress((processed, total), desc=desc, unit="files")
+            yield job_id, status["log"], get_jobs_table()
+            if status["state"] not in ("running", "cancelling"):
+                print_status(f"Job {job_id} {status['state']}", status["state"] == "completed")
+                return
+            time.sleep(PROGRESS_UPDATE_INTERVAL)
+
+    def on_start_conversion(spec, progress=gr.Progress()):
+        """Handle conversion start; the job runs in the background while progress streams."""
+        job_id, message = submit_job(spec)
+        if not job_id:
+            yield "", message, get_jobs_table()
+            return
+        yield from stream_job(job_id, progress)
 
-    def on_start_conversion():
-        """Handle conversion start."""
-        result = start_conversion()
-        print_status("Conversion completed" if "Successfully converted" in result else "Conversion encountered errors")
-        return result
+    def on_resume_conversion(spec, progress=gr.Progress()):
+        """Handle resuming the last interrupted run with its original settings."""
+        job_id, message = submit_job(spec, resume=True)
+        if not job_id:
+            yield "", message, get_jobs_table()
+            return
+        yield from stream_job(job_id, progress)
+
+    def on_attach_job(job_id, progress=gr.Progress()):
+        """Resume streaming the progress of an existing job."""
+        yield from stream_job(job_id.strip(), progress)
+
+    def on_cancel_job(job_id):
+        """Handle job cancellation."""
+        message = cancel_job(job_id.strip())
+        print_status(message)
+        return message, get_jobs_table()
 
     def on_exit():
         """Handle program exit with root permission awareness."""
+        cancel_all_jobs()
         if os.geteuid() == 0:  # Check if running as root
             print("\nWARNING: Running as root - using safer exit method")
             os._exit(0)  # Immediate exit for root
@@ -52,6 +187,8 @@ def create_gradio_interface():
     with gr.Blocks(title="NConvert-Bash Image Converter", theme=gr.themes.Default()) as demo:
         gr.Markdown("# NConvert-Bash Image Converter")
         gr.Markdown("Convert multiple image files between formats using NConvert.")
+        # Each browser session edits its own settings; a job keeps the spec it was started with
+        spec_state = gr.State(JobSpec())
         
         with gr.Row():
             folder_location_display = gr.Textbox(
@@ -67,14 +204,23 @@ def create_gradio_interface():
             format_from_input = gr.Dropdown(
                 label="Convert From",
                 choices=ALLOWED_FORMATS,
-                value=FORMAT_FROM,
+                value=FORMATS_FROM,
+                multiselect=True,
                 interactive=True,
                 scale=1
             )
             format_to_input = gr.Dropdown(
                 label="Convert To",
                 choices=ALLOWED_FORMATS,
-                value=FORMAT_TO,
+                value=FORMATS_TO,
+                multiselect=True,
+                interactive=True,
+                scale=1
+            )
+            preset_input = gr.Dropdown(
+                label="Preset",
+                choices=list(CONVERSION_PRESETS),
+                value=CONVERSION_PRESET,
                 interactive=True,
                 scale=1
             )
@@ -83,11 +229,154 @@ def create_gradio_interface():
                 value=False,
                 scale=1
             )
+            worker_count_input = gr.Slider(
+                label="Parallel Workers",
+                minimum=1,
+                maximum=MAX_WORKER_COUNT,
+                step=1,
+                value=WORKER_COUNT,
+                interactive=True,
+                scale=1
+            )
+            batch_size_input = gr.Slider(
+                label="Files Per NConvert Run",
+                minimum=1,
+                maximum=MAX_BATCH_SIZE,
+                step=1,
+                value=BATCH_SIZE,
+                interactive=True,
+                scale=1
+            )
+            incremental_mode_input = gr.Dropdown(
+                label="Skip Up-To-Date Files",
+                choices=INCREMENTAL_MODES,
+                value=INCREMENTAL_MODE,
+                interactive=True,
+                scale=1
+            )
         
+        with gr.Accordion("Advanced Settings", open=False):
+            with gr.Row():
+                retry_attempts_input = gr.Slider(
+                    label="Attempts Per File",
+                    minimum=1,
+                    maximum=5,
+                    step=1,
+                    value=RETRY_MAX_ATTEMPTS,
+                    interactive=True,
+                    scale=1
+                )
+                retry_backoff_input = gr.Number(
+                    label="Retry Backoff (seconds)",
+                    value=RETRY_BACKOFF,
+                    minimum=0,
+                    interactive=True,
+                    scale=1
+                )
+                retry_timeout_only_checkbox = gr.Checkbox(
+                    label="Retry Only Timed Out Files",
+                    value=RETRY_ON_TIMEOUT_ONLY,
+                    scale=1
+                )
+                delete_mode_input = gr.Dropdown(
+                    label="Delete Originals",
+                    choices=DELETE_MODES,
+                    value=DELETE_MODE,
+                    interactive=True,
+                    scale=1
+                )
+                backend_input = gr.Dropdown(
+                    label="Backend (Auto = Pillow for common formats)",
+                    choices=BACKENDS,
+                    value=BACKEND,
+                    interactive=True,
+                    scale=1
+                )
+                engine_input = gr.Dropdown(
+                    label="Engine",
+                    choices=ENGINES,
+                    value=ENGINE,
+                    interactive=True,
+                    scale=1
+                )
+                async_in_flight_input = gr.Slider(
+                    label="Asyncio Processes In Flight",
+                    minimum=1,
+                    maximum=MAX_ASYNC_IN_FLIGHT,
+                    step=1,
+                    value=ASYNC_IN_FLIGHT,
+                    interactive=True,
+                    scale=1
+                )
+                priority_input = gr.Dropdown(
+                    label="Job Priority (when jobs share the machine)",
+                    choices=PRIORITIES,
+                    value=PRIORITY,
+                    interactive=True,
+                    scale=1
+                )
+                scheduling_policy_input = gr.Dropdown(
+                    label="Dispatch Order",
+                    choices=SCHEDULING_POLICIES,
+                    value=SCHEDULING_POLICY,
+                    interactive=True,
+                    scale=1
+                )
+                memory_budget_input = gr.Number(
+                    label="Decode Memory Budget (MB, 0 = off)",
+                    value=MEMORY_BUDGET_MB,
+                    minimum=0,
+                    precision=0,
+                    interactive=True,
+                    scale=1
+                )
+                disk_reserve_input = gr.Number(
+                    label="Free Space Reserve (MB, 0 = off)",
+                    value=DISK_RESERVE_MB,
+                    minimum=0,
+                    precision=0,
+                    interactive=True,
+                    scale=1
+                )
+                sniff_formats_checkbox = gr.Checkbox(
+                    label="Detect Formats By Content",
+                    value=SNIFF_FORMATS,
+                    scale=1
+                )
+                deduplicate_checkbox = gr.Checkbox(
+                    label="Convert Identical Files Once",
+                    value=DEDUPLICATE,
+                    scale=1
+                )
+                use_cache_checkbox = gr.Checkbox(
+                    label="Reuse Cached Outputs",
+                    value=USE_CACHE,
+                    scale=1
+                )
+
         with gr.Row():
             start_button = gr.Button("Start Conversion", variant="primary", scale=4)
+            resume_button = gr.Button("Resume Last Run", scale=1)
             exit_button = gr.Button("Exit Program", variant="stop", scale=1)
 
+        with gr.Row():
+            job_id_display = gr.Textbox(
+                label="Job ID",
+                interactive=True,
+                scale=3,
+                placeholder="Set when a conversion starts; paste an ID to follow a running job"
+            )
+            attach_button = gr.Button("Show Job", scale=1, variant="secondary")
+            cancel_button = gr.Button("Cancel Job", scale=1, variant="stop")
+            refresh_jobs_button = gr.Button("Refresh Jobs", scale=1, variant="secondary")
+
+        jobs_table = gr.Dataframe(
+            label="Jobs (all sessions)",
+            headers=JOB_TABLE_HEADERS,
+            value=[],
+            interactive=False
+        )
+
         result_output = gr.Textbox(
             label="Conversion Results",
             interactive=False,
@@ -99,38 +388,166 @@ def create_gradio_interface():
         # Connect events
         browse_button.click(
             fn=on_browse_folder,
-            inputs=None,
-            outputs=folder_location_display
+            inputs=spec_state,
+            outputs=[folder_location_display, spec_state]
         )
         
         folder_location_display.change(
-            fn=set_folder_location,
-            inputs=folder_location_display,
-            outputs=folder_location_display
+            fn=on_folder_location_change,
+            inputs=[folder_location_display, spec_state],
+            outputs=spec_state
         )
         
         format_from_input.change(
             fn=on_format_from_change,
-            inputs=format_from_input,
-            outputs=None
+            inputs=[format_from_input, spec_state],
+            outputs=spec_state
         )
         
         format_to_input.change(
             fn=on_format_to_change,
-            inputs=format_to_input,
-            outputs=None
+            inputs=[format_to_input, spec_state],
+            outputs=spec_state
+        )
+        
+        preset_input.change(
+            fn=on_preset_change,
+            inputs=[preset_input, spec_state],
+            outputs=spec_state
         )
         
         delete_files_checkbox.change(
             fn=on_delete_change,
-            inputs=delete_files_checkbox,
-            outputs=None
+            inputs=[delete_files_checkbox, spec_state],
+            outputs=spec_state
+        )
+        
+        worker_count_input.change(
+            fn=on_worker_count_change,
+            inputs=[worker_count_input, spec_state],
+            outputs=spec_state
+        )
+        
+        batch_size_input.change(
+            fn=on_batch_size_change,
+            inputs=[batch_size_input, spec_state],
+            outputs=spec_state
+        )
+        
+        incremental_mode_input.change(
+            fn=on_incremental_mode_change,
+            inputs=[incremental_mode_input, spec_state],
+            outputs=spec_state
         )
         
+        for retry_input in (retry_attempts_input, retry_backoff_input, retry_timeout_only_checkbox):
+            retry_input.change(
+                fn=on_retry_policy_change,
+                inputs=[retry_attempts_input, retry_backoff_input, retry_timeout_only_checkbox, spec_state],
+                outputs=spec_state
+            )
+        
+        delete_mode_input.change(
+            fn=on_delete_mode_change,
+            inputs=[delete_mode_input, spec_state],
+            outputs=spec_state
+        )
+        
+        scheduling_policy_input.change(
+            fn=on_scheduling_policy_change,
+            inputs=[scheduling_policy_input, spec_state],
+            outputs=spec_state
+        )
+        
+        memory_budget_input.change(
+            fn=on_memory_budget_change,
+            inputs=[memory_budget_input, spec_state],
+            outputs=spec_state
+        )
+        
+        disk_reserve_input.change(
+            fn=on_disk_reserve_change,
+            inputs=[disk_reserve_input, spec_state],
+            outputs=spec_state
+        )
+        
+        backend_input.change(
+            fn=on_backend_change,
+            inputs=[backend_input, spec_state],
+            outputs=spec_state
+        )
+        
+        engine_input.change(
+            fn=on_engine_change,
+            inputs=[engine_input, spec_state],
+            outputs=spec_state
+        )
+        
+        async_in_flight_input.change(
+            fn=on_async_in_flight_change,
+            inputs=[async_in_flight_input, spec_state],
+            outputs=spec_state
+        )
+        
+        priority_input.change(
+            fn=on_priority_change,
+            inputs=[priority_input, spec_state],
+            outputs=spec_state
+        )
+        
+        sniff_formats_checkbox.change(
+            fn=on_sniff_formats_change,
+            inputs=[sniff_formats_checkbox, spec_state],
+            outputs=spec_state
+        )
+        
+        deduplicate_checkbox.change(
+            fn=on_deduplicate_change,
+            inputs=[deduplicate_checkbox, spec_state],
+            outputs=spec_state
+        )
+        
+        use_cache_checkbox.change(
+            fn=on_use_cache_change,
+            inputs=[use_cache_checkbox, spec_state],
+            outputs=spec_state
+        )
+        
+        # Streaming handlers only poll their job, so sessions' jobs are never queued behind each other
         start_button.click(
             fn=on_start_conversion,
+            inputs=spec_state,
+            outputs=[job_id_display, result_output, jobs_table],
+            concurrency_limit=None
+        )
+        
+        resume_button.click(
+            fn=on_resume_conversion,
+            inputs=spec_state,
+            outputs=[job_id_display, result_output, jobs_table],
+            concurrency_limit=None
+        )
+        
+        attach_button.click(
+            fn=on_attach_job,
+            inputs=job_id_display,
+            outputs=[job_id_display, result_output, jobs_table],
+            concurrency_limit=None
+        )
+        
+        # Runs outside the queue so it is never stuck behind a streaming job
+        cancel_button.click(
+            fn=on_cancel_job,
+            inputs=job_id_display,
+            outputs=[result_output, jobs_table],
+            queue=False
+        )
+        
+        refresh_jobs_button.click(
+            fn=get_jobs_table,
             inputs=None,
-            outputs=result_output
+            outputs=jobs_table,
+            queue=False
         )
         
         exit_button.click(
@@ -0,0 +1,192 @@
+# Script: `.\scripts\job_spec.py`
+# Note: immutable conversion settings; each session and run holds its own, so concurrent jobs never share them
+
+# Imports
+import os
+from dataclasses import dataclass, asdict, replace
+from scripts.temporary import (
+    FOLDER_LOCATION, FORMATS_FROM, FORMATS_TO, DELETE_FILES_AFTER, WORKER_COUNT,
+    MAX_WORKER_COUNT, BATCH_SIZE, MAX_BATCH_SIZE, INCREMENTAL_MODES, INCREMENTAL_MODE,
+    RETRY_MAX_ATTEMPTS, RETRY_BACKOFF, RETRY_ON_TIMEOUT_ONLY, SCHEDULING_POLICIES,
+    SCHEDULING_POLICY, MEMORY_BUDGET_MB, DEDUPLICATE, USE_CACHE, DELETE_MODES, DELETE_MODE,
+    DISK_RESERVE_MB, SNIFF_FORMATS, CONVERSION_PRESETS, CONVERSION_PRESET, BACKENDS, BACKEND,
+    ENGINES, ENGINE, ASYNC_IN_FLIGHT, MAX_ASYNC_IN_FLIGHT, PRIORITIES, PRIORITY
+)
+
+@dataclass(frozen=True)
+class JobSpec:
+    """Settings of one conversion job; changing a setting returns a new spec."""
+    folder_location: str = FOLDER_LOCATION
+    format_from: tuple = tuple(FORMATS_FROM)
+    sniff_formats: bool = SNIFF_FORMATS
+    format_to: tuple = tuple(FORMATS_TO)
+    preset: str = CONVERSION_PRESET
+    backend: str = BACKEND
+    delete_files_after: bool = DELETE_FILES_AFTER
+    delete_mode: str = DELETE_MODE
+    worker_count: int = WORKER_COUNT
+    engine: str = ENGINE
+    async_in_flight: int = ASYNC_IN_FLIGHT
+    priority: str = PRIORITY
+    batch_size: int = BATCH_SIZE
+    incremental_mode: str = INCREMENTAL_MODE
+    scheduling_policy: str = SCHEDULING_POLICY
+    memory_budget_mb: int = MEMORY_BUDGET_MB
+    disk_reserve_mb: int = DISK_RESERVE_MB
+    deduplicate: bool = DEDUPLICATE
+    use_cache: bool = USE_CACHE
+    retry_max_attempts: int = RETRY_MAX_ATTEMPTS
+    retry_backoff: float = RETRY_BACKOFF
+    retry_on_timeout_only: bool = RETRY_ON_TIMEOUT_ONLY
+
+def parse_formats(new_formats):
+    """Return formats from a list or a comma separated string, uppercase and without repeats."""
+    if isinstance(new_formats, str):
+        new_formats = new_formats.split(",")
+    formats = [new_format.strip().upper() for new_format in new_formats or [] if new_format.strip()]
+    return tuple(dict.fromkeys(formats))
+
+def parse_int(value, minimum, maximum=None):
+    """Return value as an int clamped to the given range, or None if it isn't a number."""
+    try:
+        value = max(minimum, int(value))
+    except (TypeError, ValueError):
+        return None
+    return value if maximum is None else min(value, maximum)
+
+def set_folder_location(spec, new_location):
+    """Return spec with a new folder location, if it exists."""
+    if new_location and os.path.exists(new_location):
+        return replace(spec, folder_location=new_location)
+    return spec
+
+def set_format_from(spec, new_formats):
+    """Return spec with new source formats, from a list or a comma separated string."""
+    formats = parse_formats(new_formats)
+    return replace(spec, format_from=formats) if formats else spec
+
+def set_sniff_formats(spec, should_sniff):
+    """Return spec with source files identified by content as well as extension, or not."""
+    return replace(spec, sniff_formats=bool(should_sniff))
+
+def set_format_to(spec, new_formats):
+    """Return spec with new target formats, from a list or a comma separated string."""
+    formats = parse_formats(new_formats)
+    return replace(spec, format_to=formats) if formats else spec
+
+def set_preset(spec, new_preset):
+    """Return spec with a new operation preset applied to every output."""
+    return replace(spec, preset=new_preset) if new_preset in CONVERSION_PRESETS else spec
+
+def set_backend(spec, new_backend):
+    """Return spec with a new backend for the format pairs Pillow supports."""
+    return replace(spec, backend=new_backend) if new_backend in BACKENDS else spec
+
+def set_delete_files_after(spec, should_delete):
+    """Return spec with the delete files setting changed."""
+    return replace(spec, delete_files_after=bool(should_delete))
+
+def set_delete_mode(spec, new_mode):
+    """Return spec with a new choice of when original files are deleted."""
+    return replace(spec, delete_mode=new_mode) if new_mode in DELETE_MODES else spec
+
+def set_worker_count(spec, new_count):
+    """Return spec with a new number of parallel conversion workers."""
+    count = parse_int(new_count, 1, MAX_WORKER_COUNT)
+    return replace(spec, worker_count=count) if count is not None else spec
+
+def set_engine(spec, new_engine):
+    """Return spec with a new engine driving the nconvert processes."""
+    return replace(spec, engine=new_engine) if new_engine in ENGINES else spec
+
+def set_async_in_flight(spec, new_count):
+    """Return spec with a new number of nconvert processes the asyncio engine runs at once."""
+    count = parse_int(new_count, 1, MAX_ASYNC_IN_FLIGHT)
+    return replace(spec, async_in_flight=count) if count is not None else spec
+
+def set_priority(spec, new_priority):
+    """Return spec with a new priority class, weighting its share of the shared nconvert processes."""
+    return replace(spec, priority=new_priority) if new_priority in PRIORITIES else spec
+
+def set_batch_size(spec, new_size):
+    """Return spec with a new number of files passed to each nconvert invocation."""
+    size = parse_int(new_size, 1, MAX_BATCH_SIZE)
+    return replace(spec, batch_size=size) if size is not None else spec
+
+def set_incremental_mode(spec, new_mode):
+    """Return spec with a new incremental conversion mode."""
+    return replace(spec, incremental_mode=new_mode) if new_mode in INCREMENTAL_MODES else spec
+
+def set_scheduling_policy(spec, new_policy):
+    """Return spec with a new order in which discovered files are dispatched."""
+    return replace(spec, scheduling_policy=new_policy) if new_policy in SCHEDULING_POLICIES else spec
+
+def set_memory_budget(spec, new_budget_mb):
+    """Return spec with a new memory budget for concurrent decodes, in MB (0 disables)."""
+    budget = parse_int(new_budget_mb, 0)
+    return replace(spec, memory_budget_mb=budget) if budget is not None else spec
+
+def set_disk_reserve(spec, new_reserve_mb):
+    """Return spec with a new free space reserve on the output filesystem, in MB (0 disables)."""
+    reserve = parse_int(new_reserve_mb, 0)
+    return replace(spec, disk_reserve_mb=reserve) if reserve is not None else spec
+
+def set_deduplicate(spec, should_deduplicate):
+    """Return spec with the duplicate detection setting changed."""
+    return replace(spec, deduplicate=bool(should_deduplicate))
+
+def set_use_cache(spec, should_use_cache):
+    """Return spec with the conversion cache setting changed."""
+    return replace(spec, use_cache=bool(should_use_cache))
+
+def set_retry_policy(spec, max_attempts=None, backoff=None, timeout_only=None):
+    """Return spec with the given parts of the retry policy changed."""
+    changes = {}
+    attempts = parse_int(max_attempts, 1)
+    if attempts is not None:
+        changes["retry_max_attempts"] = attempts
+    try:
+        if backoff is not None:
+            changes["retry_backoff"] = max(0.0, float(backoff))
+    except (TypeError, ValueError):
+        pass
+    if timeout_only is not None:
+        changes["retry_on_timeout_only"] = bool(timeout_only)
+    return replace(spec, **changes)
+
+# Setter for each stored setting, so restored values get the same checks as new ones
+SETTERS = {
+    "folder_location": set_folder_location,
+    "format_from": set_format_from,
+    "sniff_formats": set_sniff_formats,
+    "format_to": set_format_to,
+    "preset": set_preset,
+    "backend": set_backend,
+    "delete_files_after": set_delete_files_after,
+    "delete_mode": set_delete_mode,
+    "worker_count": set_worker_count,
+    "engine": set_engine,
+    "async_in_flight": set_async_in_flight,
+    "priority": set_priority,
+    "batch_size": set_batch_size,
+    "incremental_mode": set_incremental_mode,
+    "scheduling_policy": set_scheduling_policy,
+    "memory_budget_mb": set_memory_budget,
+    "disk_reserve_mb": set_disk_reserve,
+    "deduplicate": set_deduplicate,
+    "use_cache": set_use_cache,
+    "retry_max_attempts": lambda spec, value: set_retry_policy(spec, max_attempts=value),
+    "retry_backoff": lambda spec, value: set_retry_policy(spec, backoff=value),
+    "retry_on_timeout_only": lambda spec, value: set_retry_policy(spec, timeout_only=value)
+}
+
+def get_settings(spec):
+    """Return a spec's settings as a plain dict, as stored with each journaled run."""
+    return asdict(spec)
+
+def apply_settings(spec, settings):
+    """Return spec with stored settings applied; unknown or invalid ones are ignored."""
+    for name, value in settings.items():
+        if name in SETTERS:
+            spec = SETTERS[name](spec, value)
+    return spec
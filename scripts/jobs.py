@@ -0,0 +1,133 @@
+# Script: `.\scripts\jobs.py`
+
+# Imports
+import threading
+import time
+import uuid
+from collections import deque
+from scripts.temporary import LOG_TAIL_LINES, JOBS_KEEP_FINISHED
+from scripts import utility
+
+# Conversion jobs by ID, oldest first
+JOBS = {}
+JOBS_LOCK = threading.Lock()
+
+def get_running_job_ids():
+    """Return the IDs of the jobs currently converting, oldest first."""
+    with JOBS_LOCK:
+        return [job_id for job_id, job in JOBS.items() if job["state"] in ("running", "cancelling")]
+
+def prune_jobs():
+    """Drop the oldest finished jobs beyond JOBS_KEEP_FINISHED, with their runs and logs."""
+    with JOBS_LOCK:
+        finished = [job_id for job_id, job in JOBS.items() if job["finished"] is not None]
+        for job_id in finished[:max(0, len(finished) - JOBS_KEEP_FINISHED)]:
+            del JOBS[job_id]
+
+def run_job(job):
+    """Run a conversion on the job's background thread, recording its log."""
+    try:
+        log_file = utility.create_log_file()
+        job["log_path"] = log_file.name
+        job["lines"].append(f"Full log: {log_file.name}\n")
+    except OSError as e:
+        log_file = None
+        print(f"Could not create log file: {e}")
+
+    try:
+        for line in utility.iter_conversion(job["run"]):
+            job["lines"].append(line)
+            if log_file:
+                log_file.write(line)
+        job["state"] = "cancelled" if job["run"].cancelled.is_set() else "completed"
+    except Exception as e:
+        job["lines"].append(f"Error: {e}\n")
+        job["state"] = "failed"
+    finally:
+        if log_file:
+            log_file.close()
+        job["finished"] = time.time()
+        prune_jobs()
+
+def submit_job(spec, resume=False):
+    """Start a conversion job for spec in the background, returning (job_id, message); a resumed job uses its stored settings."""
+    resume_run_id = None
+    if resume:
+        resumable = utility.prepare_resume()
+        if not resumable:
+            return None, "No interrupted run to resume."
+        resume_run_id, spec = resumable
+
+    job_id = uuid.uuid4().hex[:8]
+    job = {
+        "id": job_id,
+        "state": "running",
+        "started": time.time(),
+        "finished": None,
+        "log_path": None,
+        "lines": deque(maxlen=LOG_TAIL_LINES),
+        "run": utility.ConversionRun(spec, resume_run_id)
+    }
+    with JOBS_LOCK:
+        JOBS[job_id] = job
+    job["thread"] = threading.Thread(target=run_job, args=(job,), daemon=True)
+    job["thread"].start()
+    return job_id, f"Started job {job_id}."
+
+def get_job_status(job_id):
+    """Return a snapshot of a job's state, progress and recent log, or None."""
+    with JOBS_LOCK:
+        job = JOBS.get(job_id)
+    if not job:
+        return None
+    processed, total, scan_complete = job["run"].get_progress()
+    queued, queue_wait = job["run"].get_queue_stats()
+    return {
+        "id": job_id,
+        "state": job["state"],
+        "priority": job["run"].spec.priority,
+        "processed": processed,
+        "total": total,
+        "scan_complete": scan_complete,
+        "queued": queued,
+        "queue_wait": queue_wait,
+        "running": utility.SHARED_SCHEDULER.get_slots(job["run"]),
+        "elapsed": (job["finished"] or time.time()) - job["started"],
+        "log_path": job["log_path"],
+        "log": "".join(job["lines"])
+    }
+
+def list_jobs():
+    """Return status snapshots of every job, newest first."""
+    with JOBS_LOCK:
+        job_ids = list(JOBS)
+    return [get_job_status(job_id) for job_id in reversed(job_ids)]
+
+def wait_for_job(job_id, timeout=None):
+    """Block until a job finishes; returns whether it did."""
+    with JOBS_LOCK:
+        job = JOBS.get(job_id)
+    if not job:
+        return True
+    job["thread"].join(timeout)
+    return not job["thread"].is_alive()
+
+def cancel_job(job_id):
+    """Cancel a running job and terminate its nconvert processes."""
+    with JOBS_LOCK:
+        job = JOBS.get(job_id)
+    if not job:
+        return f"No job with ID '{job_id}'."
+    if job["state"] != "running":
+        return f"Job {job_id} is already {job['state']}."
+    job["state"] = "cancelling"
+    terminated = utility.cancel_conversion(job["run"])
+    return f"Cancelling job {job_id}; terminated {terminated} nconvert processes."
+
+def cancel_all_jobs():
+    """Cancel every running job, e.g. before the program exits."""
+    running_job_ids = get_running_job_ids()
+    for job_id in running_job_ids:
+        cancel_job(job_id)
+    for job_id in running_job_ids:
+        wait_for_job(job_id, timeout=10)
@@ -0,0 +1,146 @@
+# Script: `.\scripts\journal.py`
+# Note: SQLite journal of conversion runs, so an interrupted run can be resumed
+
+# Imports
+import os
+import json
+import time
+import sqlite3
+from scripts.temporary import JOURNAL_FLUSH_INTERVAL, JOURNAL_FLUSH_ROWS, JOURNAL_KEEP_RUNS
+
+# Runs in these states stopped before finishing and can be resumed
+RESUMABLE_STATES = ("running", "cancelled")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started REAL NOT NULL,
+    updated REAL NOT NULL,
+    state TEXT NOT NULL,
+    settings TEXT NOT NULL,
+    pid INTEGER
+);
+CREATE TABLE IF NOT EXISTS files (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    state TEXT NOT NULL,
+    error TEXT NOT NULL DEFAULT '',
+    updated REAL NOT NULL,
+    PRIMARY KEY (run_id, path)
+);
+"""
+
+def connect(path):
+    """Open the journal database, creating its tables if needed."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection = sqlite3.connect(path)
+    # WAL keeps commits cheap; NORMAL sync is still durable against process crashes
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute("PRAGMA foreign_keys=ON")
+    connection.executescript(SCHEMA)
+    # Journals written before runs recorded their owner
+    if "pid" not in [row[1] for row in connection.execute("PRAGMA table_info(runs)")]:
+        try:
+            connection.execute("ALTER TABLE runs ADD COLUMN pid INTEGER")
+        except sqlite3.OperationalError:
+            pass
+    return connection
+
+def is_owner_alive(pid):
+    """Check whether the process that owns a run is still running."""
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def find_resumable_run(path, run_id=None, exclude=()):
+    """Return (run_id, settings) of the given or latest interrupted run not in exclude, or None."""
+    if not os.path.exists(path):
+        return None
+    connection = connect(path)
+    try:
+        if run_id is None:
+            rows = connection.execute(
+                f"SELECT id, settings, state, pid FROM runs WHERE state IN ({','.join('?' * len(RESUMABLE_STATES))}) "
+                "ORDER BY id DESC", RESUMABLE_STATES)
+        else:
+            rows = connection.execute("SELECT id, settings, state, pid FROM runs WHERE id = ?", (run_id,))
+        # A run still marked running whose owner is alive is in progress in another process;
+        # those in progress in this one are passed in exclude
+        for row_id, settings, state, pid in rows:
+            if row_id in exclude or (state == "running" and pid != os.getpid() and is_owner_alive(pid)):
+                if run_id is None:
+                    continue
+                return None
+            return row_id, json.loads(settings)
+    finally:
+        connection.close()
+    return None
+
+class RunJournal:
+    """Records the state of each file in a run, writing changes in batched transactions."""
+
+    def __init__(self, path):
+        self.connection = connect(path)
+        self.run_id = None
+        self.pending = {}
+        self.last_flush = time.monotonic()
+
+    def start_run(self, settings):
+        """Begin a new run, dropping the oldest finished runs beyond the kept number."""
+        now = time.time()
+        with self.connection:
+            self.run_id = self.connection.execute(
+                "INSERT INTO runs (started, updated, state, settings, pid) VALUES (?, ?, 'running', ?, ?)",
+                (now, now, json.dumps(settings), os.getpid())).lastrowid
+            self.connection.execute(
+                "DELETE FROM runs WHERE id <= ? AND state NOT IN ('running', 'cancelled')",
+                (self.run_id - JOURNAL_KEEP_RUNS,))
+        return self.run_id
+
+    def resume_run(self, run_id):
+        """Continue an earlier run, returning its file states by path."""
+        self.run_id = run_id
+        with self.connection:
+            self.connection.execute("UPDATE runs SET state = 'running', updated = ?, pid = ? WHERE id = ?",
+                                    (time.time(), os.getpid(), run_id))
+        return dict(self.connection.execute("SELECT path, state FROM files WHERE run_id = ?", (run_id,)))
+
+    def record(self, path, state, error=""):
+        """Queue a file's new state; repeated changes before a flush are written once."""
+        self.pending[path] = (state, error, time.time())
+        if len(self.pending) >= JOURNAL_FLUSH_ROWS:
+            self.flush(force=True)
+
+    def flush(self, force=False):
+        """Write queued states in one transaction, at most once per flush interval unless forced."""
+        if not self.pending or (not force and time.monotonic() - self.last_flush < JOURNAL_FLUSH_INTERVAL):
+            return
+        rows = [(self.run_id, path, state, error, updated) for path, (state, error, updated) in self.pending.items()]
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO files (run_id, path, state, error, updated) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (run_id, path) DO UPDATE SET "
+                "state = excluded.state, error = excluded.error, updated = excluded.updated", rows)
+            self.connection.execute("UPDATE runs SET updated = ? WHERE id = ?", (time.time(), self.run_id))
+        self.pending.clear()
+        self.last_flush = time.monotonic()
+
+    def finish_run(self, state):
+        """Write outstanding states and mark the run completed or cancelled."""
+        self.flush(force=True)
+        with self.connection:
+            self.connection.execute("UPDATE runs SET state = ?, updated = ? WHERE id = ?", (state, time.time(), self.run_id))
+
+    def close(self):
+        """Write outstanding states and close the database."""
+        try:
+            self.flush(force=True)
+        finally:
+            self.connection.close()
@@ -0,0 +1,109 @@
+# Script: `.\scripts\metrics.py`
+# Note: process-wide conversion counters, rendered in the Prometheus text format for /metrics
+
+# Imports
+import bisect
+import threading
+from scripts.cache import get_cache_summary
+from scripts.temporary import METRICS_PREFIX, METRICS_LATENCY_BUCKETS, PRIORITIES
+
+# Counters since the program started, keyed by label values
+METRICS_LOCK = threading.Lock()
+FILES_CONVERTED = {}
+FILES_FAILED = {}
+BYTES_IN = {}
+BYTES_OUT = {}
+# Latency histograms by (source, target, backend): [count per bucket, +Inf included], sum
+LATENCY_BUCKET_COUNTS = {}
+LATENCY_SUMS = {}
+
+def record_result(source_format, target_format, result, timed):
+    """Count one finished file; timed files are also observed in the latency histogram."""
+    pair = (source_format or "unknown", target_format)
+    with METRICS_LOCK:
+        if result["success"]:
+            FILES_CONVERTED[pair] = FILES_CONVERTED.get(pair, 0) + 1
+            BYTES_IN[pair] = BYTES_IN.get(pair, 0) + result["input_bytes"]
+            BYTES_OUT[pair] = BYTES_OUT.get(pair, 0) + result["output_bytes"]
+        else:
+            FILES_FAILED[pair] = FILES_FAILED.get(pair, 0) + 1
+        if timed:
+            key = pair + (result["backend"] or "unknown",)
+            counts = LATENCY_BUCKET_COUNTS.setdefault(key, [0] * (len(METRICS_LATENCY_BUCKETS) + 1))
+            counts[bisect.bisect_left(METRICS_LATENCY_BUCKETS, result["exec_time"])] += 1
+            LATENCY_SUMS[key] = LATENCY_SUMS.get(key, 0.0) + result["exec_time"]
+
+def format_labels(names, values):
+    """Format label pairs as {name="value",...}, escaped for the text format."""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def format_metric(name, metric_type, help_text, samples, label_names=()):
+    """Return the lines of one metric family from {label values: value}."""
+    lines = [f"# HELP {METRICS_PREFIX}_{name} {help_text}", f"# TYPE {METRICS_PREFIX}_{name} {metric_type}"]
+    for label_values, value in sorted(samples.items()):
+        lines.append(f"{METRICS_PREFIX}_{name}{format_labels(label_names, label_values)} {value}")
+    return lines
+
+def format_latency():
+    """Return the lines of the conversion latency histogram."""
+    name = f"{METRICS_PREFIX}_conversion_duration_seconds"
+    lines = [f"# HELP {name} Wall time of each converted file, excluding cache hits and duplicates.",
+             f"# TYPE {name} histogram"]
+    label_names = ("source_format", "target_format", "backend")
+    for key, counts in sorted(LATENCY_BUCKET_COUNTS.items()):
+        # Buckets are cumulative in the exposition format
+        cumulative = 0
+        for bound, count in zip(METRICS_LATENCY_BUCKETS + ["+Inf"], counts):
+            cumulative += count
+            labels = format_labels(label_names + ("le",), key + (bound,))
+            lines.append(f"{name}_bucket{labels} {cumulative}")
+        labels = format_labels(label_names, key)
+        lines.append(f"{name}_sum{labels} {LATENCY_SUMS[key]}")
+        lines.append(f"{name}_count{labels} {cumulative}")
+    return lines
+
+def render_metrics(scheduler):
+    """Return every metric in the Prometheus text format, with live gauges read from the job scheduler."""
+    pair_labels = ("source_format", "target_format")
+    runs = scheduler.get_runs()
+    # Every priority is reported, so an idle class shows as 0 rather than missing
+    processes = 0
+    queued = {(priority,): 0 for priority in PRIORITIES}
+    jobs = {(priority,): 0 for priority in PRIORITIES}
+    for run in runs:
+        with run.processes_lock:
+            processes += len(run.processes)
+        priority = (run.spec.priority,)
+        queued[priority] += run.queued
+        jobs[priority] += 1
+    cache_summary = get_cache_summary()
+
+    lines = []
+    with METRICS_LOCK:
+        lines += format_metric("files_converted_total", "counter", "Files converted, per format pair.",
+                               FILES_CONVERTED, pair_labels)
+        lines += format_metric("files_failed_total", "counter", "Files that failed or were cancelled, per format pair.",
+                               FILES_FAILED, pair_labels)
+        lines += format_metric("input_bytes_total", "counter", "Bytes of converted source files, per format pair.",
+                               BYTES_IN, pair_labels)
+        lines += format_metric("output_bytes_total", "counter", "Bytes written for converted files, per format pair.",
+                               BYTES_OUT, pair_labels)
+        lines += format_latency()
+    lines += format_metric("nconvert_processes", "gauge", "nconvert processes running.", {(): processes})
+    lines += format_metric("process_slots_in_use", "gauge", "Shared conversion slots held by jobs.",
+                           {(): scheduler.in_use})
+    lines += format_metric("process_slots", "gauge", "Cap on concurrent conversions across jobs.", {(): scheduler.total})
+    lines += format_metric("jobs", "gauge", "Conversion jobs in progress, per priority.", jobs, ("priority",))
+    lines += format_metric("queued_files", "gauge", "Discovered files waiting to be dispatched, per priority.",
+                           queued, ("priority",))
+    lines += format_metric("cache_hits_total", "counter", "Conversion cache lookups that hit.", {(): cache_summary["hits"]})
+    lines += format_metric("cache_misses_total", "counter", "Conversion cache lookups that missed.",
+                           {(): cache_summary["misses"]})
+    lines += format_metric("cache_hit_ratio", "gauge", "Share of cache lookups that hit since the program started.",
+                           {(): cache_summary["hit_ratio"]})
+    lines += format_metric("cache_bytes", "gauge", "Bytes held in the conversion cache.", {(): cache_summary["bytes"]})
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,102 @@
+# Script: `.\scripts\pillow_backend.py`
+# Note: in-process conversion of common formats with Pillow; runs in the engine's process pool
+
+# Imports
+import time
+
+# Pillow ships with Gradio; without it every file goes to nconvert
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Modes each target can store; other modes are converted before saving
+SAVE_MODES = {
+    "JPEG": ("RGB", "L", "CMYK"),
+    "WEBP": ("RGB", "RGBA"),
+    "BMP": ("1", "L", "P", "RGB", "RGBA")
+}
+# Targets that can carry EXIF and ICC metadata over from the source
+METADATA_FORMATS = ("JPEG", "PNG", "WEBP", "TIFF")
+# nconvert -rtype names with a Pillow equivalent
+RESAMPLE_FILTERS = {"lanczos": "LANCZOS", "bicubic": "BICUBIC", "bilinear": "BILINEAR", "nearest": "NEAREST"}
+
+def is_pillow_available():
+    """Return whether Pillow can be imported."""
+    return Image is not None
+
+def get_pillow_version():
+    """Return the Pillow version, which identifies its outputs in the cache."""
+    return Image.__version__ if Image else "unavailable"
+
+def parse_preset(operations):
+    """Translate nconvert preset operations to Pillow options, or None if any has no equivalent."""
+    options = {"quality": None, "strip_metadata": False, "resize": None, "decrease_only": False, "filter": "LANCZOS"}
+    args = list(operations)
+    try:
+        while args:
+            op = args.pop(0)
+            if op == "-q":
+                options["quality"] = int(args.pop(0))
+            elif op == "-rmeta":
+                options["strip_metadata"] = True
+            elif op == "-ratio":
+                continue
+            elif op == "-rflag":
+                if args.pop(0) != "decr":
+                    return None
+                options["decrease_only"] = True
+            elif op == "-rtype":
+                options["filter"] = RESAMPLE_FILTERS[args.pop(0)]
+            elif op == "-resize" and args[0] == "longest":
+                options["resize"] = ("longest", int(args[1]))
+                del args[:2]
+            elif op == "-resize" and args[0].endswith("%") and args[1].endswith("%"):
+                options["resize"] = ("percent", float(args[0][:-1]), float(args[1][:-1]))
+                del args[:2]
+            else:
+                return None
+    except (IndexError, KeyError, ValueError):
+        return None
+    return options
+
+def resize_image(image, options):
+    """Apply the preset's resize, if any."""
+    if not options["resize"]:
+        return image
+    width, height = image.size
+    if options["resize"][0] == "longest":
+        scale = options["resize"][1] / max(width, height)
+        size = (width * scale, height * scale)
+    else:
+        size = (width * options["resize"][1] / 100, height * options["resize"][2] / 100)
+    size = (max(1, round(size[0])), max(1, round(size[1])))
+    if options["decrease_only"] and size[0] >= width and size[1] >= height:
+        return image
+    return image.resize(size, getattr(Image.Resampling, options["filter"]))
+
+def save_image(image, path, target_format, options, info):
+    """Write one output, converting the image mode when the target needs it."""
+    modes = SAVE_MODES.get(target_format)
+    if modes and image.mode not in modes:
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha and "RGBA" in modes else "RGB")
+    params = {}
+    if options["quality"] is not None and target_format in ("JPEG", "WEBP"):
+        params["quality"] = options["quality"]
+    if not options["strip_metadata"] and target_format in METADATA_FORMATS:
+        for key in ("exif", "icc_profile"):
+            if info.get(key):
+                params[key] = info[key]
+    image.save(path, format=target_format, **params)
+
+def convert_image(input_file, outputs, options):
+    """Decode a source once and write each (path, target_format) output, returning the CPU seconds used."""
+    started = time.process_time()
+    with Image.open(input_file) as image:
+        image.load()
+        info = dict(image.info)
+        resized = resize_image(image, options)
+        for path, target_format in outputs:
+            save_image(resized, path, target_format, options, info)
+    return time.process_time() - started
@@ -0,0 +1,169 @@
+# Script: `.\scripts\probe.py`
+# Note: pure-Python image header parsing; nothing is decoded
+
+# Imports
+import struct
+
+# Bytes read up front; JPEG and TIFF seek further when needed
+PROBE_READ_BYTES = 4096
+# Largest EXR header scanned for the dataWindow/channels attributes
+EXR_HEADER_BYTES = 65536
+
+def probe_png(f, head):
+    """Read PNG dimensions from the IHDR chunk."""
+    if head[12:16] != b"IHDR":
+        return None
+    width, height, bit_depth, color_type = struct.unpack(">IIBB", head[16:26])
+    channels = {0: 1, 2: 3, 3: 3, 4: 2, 6: 4}.get(color_type, 4)
+    return width, height, channels, max(bit_depth, 8)
+
+def probe_jpeg(f, head):
+    """Walk JPEG segments to the first start-of-frame marker."""
+    offset = 2
+    while True:
+        f.seek(offset)
+        marker = f.read(4)
+        if len(marker) < 4 or marker[0] != 0xFF:
+            return None
+        code = marker[1]
+        if code == 0xFF:
+            offset += 1
+            continue
+        if 0xD0 <= code <= 0xD9 or code == 0x01:
+            offset += 2
+            continue
+        length = struct.unpack(">H", marker[2:4])[0]
+        if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+            frame = f.read(6)
+            if len(frame) < 6:
+                return None
+            precision, height, width, components = struct.unpack(">BHHB", frame)
+            return width, height, components, precision
+        offset += 2 + length
+
+def probe_gif(f, head):
+    """Read the GIF logical screen size."""
+    width, height = struct.unpack("<HH", head[6:10])
+    return width, height, 4, 8
+
+def probe_bmp(f, head):
+    """Read BMP dimensions from the DIB header."""
+    header_size = struct.unpack("<I", head[14:18])[0]
+    if header_size == 12:
+        width, height, _, bpp = struct.unpack("<HHHH", head[18:26])
+    else:
+        width, height, _, bpp = struct.unpack("<iiHH", head[18:30])
+    return abs(width), abs(height), 4 if bpp == 32 else 3, 8
+
+def probe_tiff(f, head):
+    """Read the first IFD of a (classic) TIFF."""
+    endian = "<" if head[:2] == b"II" else ">"
+    if struct.unpack(endian + "H", head[2:4])[0] != 42:
+        return None
+    f.seek(struct.unpack(endian + "I", head[4:8])[0])
+    count_bytes = f.read(2)
+    if len(count_bytes) < 2:
+        return None
+    entries = f.read(12 * struct.unpack(endian + "H", count_bytes)[0])
+    tags = {}
+    for i in range(0, len(entries) - 11, 12):
+        tag, field_type, count = struct.unpack(endian + "HHI", entries[i:i + 8])
+        if field_type == 3:
+            value = struct.unpack(endian + "H", entries[i + 8:i + 10])[0]
+        elif field_type == 4:
+            value = struct.unpack(endian + "I", entries[i + 8:i + 12])[0]
+        else:
+            continue
+        # BitsPerSample with several samples points at an array; its first entry is enough
+        if tag == 258 and count > 2:
+            f.seek(value)
+            value = struct.unpack(endian + "H", f.read(2))[0]
+        tags[tag] = value
+    if 256 not in tags or 257 not in tags:
+        return None
+    return tags[256], tags[257], tags.get(277, 1), tags.get(258, 8)
+
+def probe_psd(f, head):
+    """Read the PSD file header."""
+    channels, height, width, depth = struct.unpack(">HIIH", head[12:24])
+    return width, height, channels, depth
+
+def probe_webp(f, head):
+    """Read WEBP canvas size from the VP8X, VP8 or VP8L chunk."""
+    chunk = head[12:16]
+    if chunk == b"VP8X":
+        width = 1 + int.from_bytes(head[24:27], "little")
+        height = 1 + int.from_bytes(head[27:30], "little")
+        return width, height, 4, 8
+    if chunk == b"VP8 " and head[23:26] == b"\x9d\x01\x2a":
+        width, height = struct.unpack("<HH", head[26:30])
+        return width & 0x3FFF, height & 0x3FFF, 3, 8
+    if chunk == b"VP8L" and head[20] == 0x2F:
+        bits = struct.unpack("<I", head[21:25])[0]
+        return 1 + (bits & 0x3FFF), 1 + ((bits >> 14) & 0x3FFF), 4, 8
+    return None
+
+def probe_exr(f, head):
+    """Read the EXR dataWindow and channel list attributes."""
+    f.seek(0)
+    header = f.read(EXR_HEADER_BYTES)
+    offset = 8
+    width = height = None
+    channels, bits = 0, 16
+    while offset < len(header):
+        name_end = header.find(b"\0", offset)
+        if name_end <= offset:
+            break
+        type_end = header.find(b"\0", name_end + 1)
+        if type_end < 0 or type_end + 5 > len(header):
+            break
+        name = header[offset:name_end]
+        size = struct.unpack("<I", header[type_end + 1:type_end + 5])[0]
+        value = header[type_end + 5:type_end + 5 + size]
+        if name == b"dataWindow" and len(value) == 16:
+            x_min, y_min, x_max, y_max = struct.unpack("<iiii", value)
+            width, height = x_max - x_min + 1, y_max - y_min + 1
+        elif name == b"channels":
+            position = 0
+            while position < len(value) and value[position] != 0:
+                position = value.find(b"\0", position) + 1
+                pixel_type = struct.unpack("<i", value[position:position + 4])[0]
+                bits = max(bits, 16 if pixel_type == 1 else 32)
+                channels += 1
+                position += 16
+        offset = type_end + 5 + size
+    if width is None:
+        return None
+    return width, height, channels or 3, bits
+
+# Leading bytes identifying each probeable format, checked in order
+PROBES = [
+    (b"\x89PNG\r\n\x1a\n", probe_png),
+    (b"\xff\xd8", probe_jpeg),
+    (b"GIF8", probe_gif),
+    (b"BM", probe_bmp),
+    (b"II*\x00", probe_tiff),
+    (b"MM\x00*", probe_tiff),
+    (b"8BPS", probe_psd),
+    (b"RIFF", probe_webp),
+    (b"v/1\x01", probe_exr)
+]
+
+def probe_image(path):
+    """Return (width, height, channels, bits_per_channel) from an image header, or None."""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(PROBE_READ_BYTES)
+            for magic, probe in PROBES:
+                if head.startswith(magic):
+                    if probe is probe_webp and head[8:12] != b"WEBP":
+                        return None
+                    return probe(f, head)
+    except (OSError, struct.error, IndexError, ValueError):
+        pass
+    return None
+
+def estimate_decoded_bytes(header):
+    """Return the bytes needed to hold a decoded image described by a probe result."""
+    width, height, channels, bits = header
+    return width * height * channels * max(1, (bits + 7) // 8)
@@ -7,17 +7,156 @@ import os
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 # Workspace directory for file conversions
 WORKSPACE_PATH = os.path.join(BASE_DIR, 'workspace')
+# Data directory for installed tools and persistent state
+DATA_DIR = os.path.join(BASE_DIR, 'data')
 # Path to nconvert binary
-NCONVERT_PATH = os.path.join(BASE_DIR, 'data', 'NConvert-linux64', 'nconvert')
+NCONVERT_PATH = os.path.join(DATA_DIR, 'NConvert-linux64', 'nconvert')
+# Stored source/output fingerprints for incremental conversion
+FINGERPRINTS_PATH = os.path.join(DATA_DIR, 'fingerprints.json')
+# Learned per-format conversion statistics (throughput)
+FORMAT_STATS_PATH = os.path.join(DATA_DIR, 'format_stats.json')
+# Full per-file conversion logs
+LOGS_DIR = os.path.join(DATA_DIR, 'logs')
+# Content-addressed store of converted outputs
+CACHE_DIR = os.path.join(DATA_DIR, 'cache')
+# SQLite journal of runs and their files, for resuming interrupted runs
+JOURNAL_PATH = os.path.join(DATA_DIR, 'journal.sqlite3')
 
 # Default folder location for conversions
 FOLDER_LOCATION = WORKSPACE_PATH
-# Default source format
-FORMAT_FROM = "PSPIMAGE"
-# Default target format
-FORMAT_TO = "JPEG"
+# Default source formats, all found in one scan
+FORMATS_FROM = ["PSPIMAGE"]
+# Default target formats; several are written from one decode of each source
+FORMATS_TO = ["JPEG"]
+# Lossless format each source is decoded to once when there are several targets
+INTERMEDIATE_FORMAT = "TIFF"
+# Where intermediates are written: tmpfs when available, so they never touch disk
+INTERMEDIATE_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else os.environ.get('TMPDIR', '/tmp')
 # Default setting for deleting original files
 DELETE_FILES_AFTER = False
+# Delete modes: each original right after its output is verified, or all once the run ends
+DELETE_MODES = ["Streaming", "After Run"]
+DELETE_MODE = "Streaming"
+# Inserted before the extension of outputs while nconvert writes them; renamed into place after
+TEMP_OUTPUT_SUFFIX = ".nctmp"
+# Temp outputs untouched for twice TIMEOUT_MAX were left by a killed run; scans remove them
+STALE_TEMP_AGE = 7200.0
+# Default number of parallel conversion workers
+WORKER_COUNT = os.cpu_count() or 1
+# Upper limit offered for the worker count setting
+MAX_WORKER_COUNT = max(32, WORKER_COUNT * 2)
+# Conversion engines: a worker thread per running nconvert, or one asyncio event loop driving them all
+ENGINES = ["Threads", "Asyncio"]
+# Default engine
+ENGINE = "Threads"
+# nconvert processes running at once across every job in progress, whichever session started it;
+# one per CPU unless NCONVERT_MAX_PROCESSES overrides it, e.g. for storage-bound tiny files
+MAX_NCONVERT_PROCESSES = max(1, int(os.environ.get("NCONVERT_MAX_PROCESSES", WORKER_COUNT)))
+# Default number of nconvert processes the asyncio engine keeps running at once
+ASYNC_IN_FLIGHT = MAX_NCONVERT_PROCESSES
+# Upper limit offered for the asyncio in-flight setting; more would only wait on the shared cap
+MAX_ASYNC_IN_FLIGHT = MAX_NCONVERT_PROCESSES
+# Job priority classes and their weights under fair queuing; an interactive job gets 8 process slots for each bulk one
+PRIORITY_WEIGHTS = {"Interactive": 8, "Bulk": 1}
+PRIORITIES = list(PRIORITY_WEIGHTS)
+# Default priority class
+PRIORITY = "Interactive"
+# Default number of files passed to one nconvert invocation (1 disables batching)
+BATCH_SIZE = 1
+# Upper limit offered for the batch size setting
+MAX_BATCH_SIZE = 500
+# Incremental modes: skip files whose output is already up to date
+INCREMENTAL_MODES = ["Off", "Timestamp", "Fingerprint"]
+# Default incremental mode
+INCREMENTAL_MODE = "Off"
+# Default setting for converting byte-identical files once and linking the rest
+DEDUPLICATE = False
+# Bytes hashed for the quick first comparison of same-sized files
+QUICK_HASH_BYTES = 65536
+# Default setting for reusing outputs from the conversion cache
+USE_CACHE = False
+# Size the conversion cache is trimmed to, least recently used first, in MB
+CACHE_MAX_MB = 2048
+# Default retry policy: attempts per file, base backoff seconds, retry only timeouts
+RETRY_MAX_ATTEMPTS = 2
+RETRY_BACKOFF = 1.0
+RETRY_ON_TIMEOUT_ONLY = True
+
+# Timeouts scale with input size and the learned throughput of the source format
+TIMEOUT_MIN = 5.0
+TIMEOUT_MAX = 3600.0
+TIMEOUT_SAFETY_FACTOR = 4.0
+# Assumed throughput (input bytes/second) for formats without history
+DEFAULT_THROUGHPUT = 2 * 1024 * 1024
+# Assumed decode throughput (pixels/second) for probed files without history
+DEFAULT_PIXEL_THROUGHPUT = 20 * 1000 * 1000
+# Scheduling policies: dispatch the largest estimated jobs first, or in scan order
+SCHEDULING_POLICIES = ["Largest First", "Discovery Order"]
+SCHEDULING_POLICY = "Largest First"
+# Maximum discovered files held for ordering before dispatch
+SCHEDULER_WINDOW = 100000
+# Estimated fixed cost of starting one nconvert run, in seconds
+ESTIMATED_STARTUP_COST = 0.05
+
+# Memory budget for decoded images of concurrent conversions, in MB (0 disables)
+MEMORY_BUDGET_MB = int(os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 1048576 * 0.5)
+# Free memory always left alone when psutil reports live availability, in MB
+MEMORY_RESERVE_MB = 512
+# Working buffers per decoded image (source plus converted copy)
+MEMORY_OVERHEAD_FACTOR = 2.0
+# Decoded bytes assumed per input byte when a header cannot be probed
+UNKNOWN_MEMORY_PER_BYTE = 4
+# Ready batches examined for one that fits the remaining memory budget
+SCHEDULER_FIT_CANDIDATES = 64
+
+# Free space left alone on the output filesystem, in MB (0 disables the check)
+DISK_RESERVE_MB = 1024
+# Output bytes assumed per input byte for format pairs without history or a probed header
+DEFAULT_OUTPUT_RATIO = 4.0
+# Seconds between free space checks while admission is paused
+DISK_RECHECK_INTERVAL = 5.0
+
+# Journal writes are grouped: at most one transaction per interval, or sooner once this many rows wait
+JOURNAL_FLUSH_INTERVAL = 1.0
+JOURNAL_FLUSH_ROWS = 1000
+# Finished runs kept in the journal
+JOURNAL_KEEP_RUNS = 20
+
+# Smaller files are dominated by startup cost, which TIMEOUT_MIN covers
+THROUGHPUT_MIN_SAMPLE_BYTES = 1024 * 1024
+# Weight of the newest sample when updating learned throughput
+THROUGHPUT_SMOOTHING = 0.2
+
+# Leading (offset, bytes) signatures of each format. An output must match one before its
+# original is deleted (formats without one only need a non-empty output); sniffing uses them too.
+FORMAT_MAGIC = {
+    "JPEG": [(0, b"\xff\xd8\xff")],
+    "PNG": [(0, b"\x89PNG\r\n\x1a\n")],
+    "BMP": [(0, b"BM")],
+    "GIF": [(0, b"GIF87a"), (0, b"GIF89a")],
+    "TIFF": [(0, b"II*\x00"), (0, b"MM\x00*")],
+    "HEIF": [(4, b"ftyp")],
+    "WEBP": [(8, b"WEBP")],
+    "SVG": [(0, b"<?xml"), (0, b"<svg")],
+    "PSD": [(0, b"8BPS")],
+    "PSPIMAGE": [(0, b"Paint Shop Pro Image File")],
+    "ICO": [(0, b"\x00\x00\x01\x00")],
+    "PCX": [(0, b"\x0a")],
+    "JP2": [(0, b"\x00\x00\x00\x0cjP  \r\n\x87\n"), (0, b"\xff\x4f\xff\x51")],
+    "EXR": [(0, b"v/1\x01")]
+}
+# Bytes read when sniffing a file's format from its content
+SNIFF_BYTES = 32
+# Default setting for identifying source files by content rather than extension alone
+SNIFF_FORMATS = False
+# File extensions of each format; formats not listed use their lowercase name
+EXTENSION_ALIASES = {
+    "JPEG": ["jpeg", "jpg", "jpe", "jfif"],
+    "TIFF": ["tiff", "tif"],
+    "HEIF": ["heif", "heic"],
+    "PSPIMAGE": ["pspimage", "psp"],
+    "JP2": ["jp2", "j2k", "jpf", "jpx"]
+}
 
 # Allowed file formats (uppercase for consistency)
 ALLOWED_FORMATS = [
@@ -25,6 +164,42 @@ ALLOWED_FORMATS = [
     "ICO", "TGA", "PCX", "JP2", "EXR"
 ]
 
-# Conversion progress tracking
-FILES_PROCESS_DONE = 0
-FILES_PROCESS_TOTAL = 0
+# Named chains of nconvert operations, applied in order in the same run that writes each output
+CONVERSION_PRESETS = {
+    "None": [],
+    "Web (1920px, quality 85, no metadata)": [
+        "-rtype", "lanczos", "-rflag", "decr", "-resize", "longest", "1920", "-q", "85", "-rmeta"
+    ],
+    "Thumbnail (256px, quality 80, no metadata)": [
+        "-rtype", "lanczos", "-rflag", "decr", "-resize", "longest", "256", "-q", "80", "-rmeta"
+    ],
+    "Half Size": ["-ratio", "-rtype", "lanczos", "-resize", "50%", "50%"],
+    "Strip Metadata": ["-rmeta"],
+    "Maximum Quality": ["-q", "100"]
+}
+# Default preset
+CONVERSION_PRESET = "None"
+
+# Conversion backends: nconvert for every file, or Pillow in-process for the pairs it supports
+BACKENDS = ["NConvert", "Auto"]
+# Default backend
+BACKEND = "NConvert"
+# Formats the Pillow backend reads and writes; pairs involving any other format use nconvert
+PILLOW_FORMATS = ["JPEG", "PNG", "WEBP", "BMP", "GIF", "TIFF"]
+# Per-pair backend under Auto, overriding the default, e.g. {"TIFF->JPEG": "NConvert"}
+BACKEND_OVERRIDES = {}
+
+# Maximum discovered files buffered between the scanner and the workers
+SCAN_QUEUE_SIZE = 10000
+# Seconds a cancelled nconvert process gets to exit before it is killed
+CANCEL_GRACE_PERIOD = 2.0
+# Number of recent log lines kept in the results box
+LOG_TAIL_LINES = 200
+# Finished jobs kept for status polling and the jobs table; older ones are dropped
+JOBS_KEEP_FINISHED = 20
+# Minimum seconds between progress updates sent to the browser
+PROGRESS_UPDATE_INTERVAL = 0.5
+# Prefix of the metric names served at /metrics
+METRICS_PREFIX = "nconvert_bash"
+# Upper bounds of the conversion latency histogram buckets served at /metrics, in seconds
+METRICS_LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0]
@@ -2,160 +2,1835 @@
 
 # Imports
 import os
+import json
+import asyncio
+import fcntl
+import heapq
+import queue
+import shutil
+import hashlib
+import signal
+import itertools
+import multiprocessing
+import sqlite3
 import subprocess
-from tkinter import Tk, filedialog
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from scripts.probe import probe_image, estimate_decoded_bytes
+from scripts.journal import RunJournal, find_resumable_run
+from scripts.job_spec import JobSpec, get_settings, apply_settings
+from scripts.metrics import record_result
+from scripts.pillow_backend import convert_image, parse_preset, is_pillow_available, get_pillow_version
+from scripts.cache import (
+    get_cache_key, get_cache_path, get_nconvert_id, cache_lookup, cache_commit, get_cache_summary
+)
 from scripts.temporary import (
-    FOLDER_LOCATION, FORMAT_FROM, FORMAT_TO, DELETE_FILES_AFTER,
-    FILES_PROCESS_DONE, FILES_PROCESS_TOTAL, NCONVERT_PATH
+    NCONVERT_PATH, MAX_WORKER_COUNT, FINGERPRINTS_PATH, LOGS_DIR, SCAN_QUEUE_SIZE,
+    CANCEL_GRACE_PERIOD, FORMAT_STATS_PATH, TIMEOUT_MIN, TIMEOUT_MAX, TIMEOUT_SAFETY_FACTOR,
+    DEFAULT_THROUGHPUT, THROUGHPUT_SMOOTHING, THROUGHPUT_MIN_SAMPLE_BYTES, SCHEDULER_WINDOW,
+    ESTIMATED_STARTUP_COST, MEMORY_RESERVE_MB, MEMORY_OVERHEAD_FACTOR, UNKNOWN_MEMORY_PER_BYTE,
+    SCHEDULER_FIT_CANDIDATES, DEFAULT_PIXEL_THROUGHPUT, QUICK_HASH_BYTES, JOURNAL_PATH,
+    TEMP_OUTPUT_SUFFIX, FORMAT_MAGIC, DEFAULT_OUTPUT_RATIO, DISK_RECHECK_INTERVAL,
+    ALLOWED_FORMATS, SNIFF_BYTES, EXTENSION_ALIASES, INTERMEDIATE_FORMAT, INTERMEDIATE_DIR,
+    CONVERSION_PRESETS, PILLOW_FORMATS, BACKEND_OVERRIDES, MAX_NCONVERT_PROCESSES,
+    PRIORITY_WEIGHTS, STALE_TEMP_AGE
+)
+
+# psutil gives a live view of free memory; without it only the budget applies
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Learned statistics per format, loaded from FORMAT_STATS_PATH and shared by all runs
+FORMAT_STATS = None
+FORMAT_STATS_LOCK = threading.Lock()
+# Serializes read-modify-write of the fingerprint store between concurrent runs
+FINGERPRINTS_LOCK = threading.Lock()
+# Process pool of the Pillow backend, started on first use and kept between runs
+PILLOW_POOL = None
+PILLOW_POOL_LOCK = threading.Lock()
+# Journal runs owned by a conversion in this process, from the moment they are resumed or started
+CLAIMED_RUN_IDS = set()
+CLAIMED_RUN_IDS_LOCK = threading.Lock()
+# Tells apart run logs opened in the same second
+RUN_LOG_SEQUENCE = itertools.count(1)
+# Tells apart the temp outputs of Pillow attempts, as a timed out one can't be stopped
+PILLOW_ATTEMPT_SEQUENCE = itertools.count(1)
+# Signatures tried when sniffing, longest first so specific matches win; one-byte ones are too weak
+SNIFF_SIGNATURES = sorted(
+    [(source_format, offset, magic) for source_format, signatures in FORMAT_MAGIC.items()
+     for offset, magic in signatures if len(magic) > 1],
+    key=lambda signature: -len(signature[2])
 )
 
-def set_folder_location(new_location):
-    """Update the global folder location."""
-    global FOLDER_LOCATION
-    if new_location and os.path.exists(new_location):
-        FOLDER_LOCATION = new_location
-    return FOLDER_LOCATION
-
-def set_format_from(new_format):
-    """Update the source format."""
-    global FORMAT_FROM
-    if new_format:
-        FORMAT_FROM = new_format.upper()
-    return FORMAT_FROM
-
-def set_format_to(new_format):
-    """Update the target format."""
-    global FORMAT_TO
-    if new_format:
-        FORMAT_TO = new_format.upper()
-    return FORMAT_TO
-
-def set_delete_files_after(should_delete):
-    """Update the delete files setting."""
-    global DELETE_FILES_AFTER
-    DELETE_FILES_AFTER = bool(should_delete)
-    return DELETE_FILES_AFTER
-
-def browse_folder():
+class ConversionRun:
+    """One conversion: its spec, progress counters, cancel flag and running nconvert processes."""
+
+    def __init__(self, spec, resume_run_id=None):
+        self.spec = spec
+        self.resume_run_id = resume_run_id
+        # Journal ID of the run, so resuming never picks a run still in progress
+        self.journal_id = resume_run_id
+        self.cancelled = threading.Event()
+        # Set when a batch finishes or a process slot frees up for this run
+        self.wakeup = threading.Event()
+        self.processes = set()
+        self.processes_lock = threading.Lock()
+        self.done = 0
+        self.failed = 0
+        self.total = 0
+        self.scan_complete = False
+        # Files discovered but not yet dispatched, and the time dispatched files spent waiting
+        self.queued = 0
+        self.dispatched = 0
+        self.queue_wait = 0.0
+        # Cache counters are bumped from worker threads
+        self.cache_stats = {"hits": 0, "misses": 0, "stored": 0}
+        self.cache_stats_lock = threading.Lock()
+
+    def get_progress(self):
+        """Return (processed, total, scan_complete)."""
+        return self.done + self.failed, self.total, self.scan_complete
+
+    def get_queue_stats(self):
+        """Return (queued files, mean seconds a dispatched file waited)."""
+        return self.queued, self.queue_wait / self.dispatched if self.dispatched else 0.0
+
+    def count_cache(self, outcome):
+        """Count a cache hit, miss or stored file."""
+        with self.cache_stats_lock:
+            self.cache_stats[outcome] += 1
+
+class FairScheduler:
+    """Hands the shared nconvert process slots to runs by weighted fair queuing."""
+
+    def __init__(self, total):
+        self.total = total
+        self.in_use = 0
+        self.virtual_time = 0.0
+        self.runs = {}
+        self.lock = threading.Lock()
+
+    def join(self, run, weight):
+        """Register a run with its priority weight."""
+        with self.lock:
+            self.runs[run] = {"weight": weight, "finish": self.virtual_time, "start": 0.0,
+                              "waiting": False, "slots": 0}
+
+    def leave(self, run):
+        """Unregister a finished run."""
+        with self.lock:
+            self.runs.pop(run, None)
+
+    # Start-time fair queuing: a dispatch starts at max(virtual time, the run's last finish tag) and
+    # finishes files / weight later. The waiting run with the lowest start tag gets the next slot, so
+    # slots follow priority weights and a run that sat idle gets no credit for it.
+    def get_start(self, state):
+        """Return the start tag of a run's next dispatch."""
+        return max(self.virtual_time, state["finish"])
+
+    def set_waiting(self, run, waiting):
+        """Mark whether a run has work ready that only needs a slot."""
+        with self.lock:
+            if run in self.runs:
+                self.runs[run]["waiting"] = waiting
+
+    def acquire(self, run):
+        """Take a slot for run if one is free and no waiting run is owed it first."""
+        with self.lock:
+            state = self.runs[run]
+            if self.in_use >= self.total:
+                return False
+            start = self.get_start(state)
+            for other, other_state in self.runs.items():
+                if other is not run and other_state["waiting"] and self.get_start(other_state) < start:
+                    # Nudge the run that is owed the slot, in case it is waiting on its own batches
+                    other.wakeup.set()
+                    return False
+            self.in_use += 1
+            state["slots"] += 1
+            state["start"] = start
+            self.virtual_time = start
+            return True
+
+    def charge(self, run, files):
+        """Advance a run's finish tag by the files it just dispatched, scaled by its weight."""
+        with self.lock:
+            state = self.runs[run]
+            state["finish"] = state["start"] + files / state["weight"]
+
+    def release(self, run):
+        """Return a slot, waking the waiting run that is owed the next one."""
+        with self.lock:
+            self.in_use -= 1
+            if run in self.runs:
+                self.runs[run]["slots"] -= 1
+            waiting = [(self.get_start(state), other) for other, state in self.runs.items() if state["waiting"]]
+        if waiting:
+            min(waiting, key=lambda item: item[0])[1].wakeup.set()
+
+    def get_slots(self, run):
+        """Return the slots a run holds."""
+        with self.lock:
+            state = self.runs.get(run)
+            return state["slots"] if state else 0
+
+    def get_runs(self):
+        """Return the runs in progress."""
+        with self.lock:
+            return list(self.runs)
+
+# The one cap on nconvert processes, shared by every job in this process
+SHARED_SCHEDULER = FairScheduler(MAX_NCONVERT_PROCESSES)
+
+def prepare_resume(run_id=None):
+    """Return (run_id, spec) of an interrupted run to resume, claiming it for the caller, or None."""
+    # Runs in progress here are journaled as running too, but they are not interrupted; the claim is
+    # taken at once, so a second request can't pick the same run before the first one starts
+    with CLAIMED_RUN_IDS_LOCK:
+        if run_id in CLAIMED_RUN_IDS:
+            return None
+        try:
+            run = find_resumable_run(JOURNAL_PATH, run_id, exclude=CLAIMED_RUN_IDS)
+        except sqlite3.Error as e:
+            print(f"Could not read the run journal: {e}")
+            run = None
+        if not run:
+            return None
+        resume_run_id, settings = run
+        CLAIMED_RUN_IDS.add(resume_run_id)
+    return resume_run_id, apply_settings(JobSpec(), settings)
+
+def release_run_id(run_id):
+    """Let a journal run be resumed again once the conversion that claimed it has ended."""
+    with CLAIMED_RUN_IDS_LOCK:
+        CLAIMED_RUN_IDS.discard(run_id)
+
+def browse_folder(initial_dir):
     """Open a folder selection dialog using tkinter."""
     try:
+        # Imported here so headless runs never need a display-capable Python
+        from tkinter import Tk, filedialog
         root = Tk()
         root.withdraw()
-        folder_selected = filedialog.askdirectory(initialdir=FOLDER_LOCATION)
+        folder_selected = filedialog.askdirectory(initialdir=initial_dir)
         root.destroy()
         if folder_selected:
             return folder_selected
-        return FOLDER_LOCATION
+        return initial_dir
     except Exception as e:
         print(f"Error opening folder dialog: {e}")
-        return FOLDER_LOCATION
+        return initial_dir
 
-def find_files_to_convert():
-    """Find all files matching the source format in the specified folder."""
-    if not os.path.exists(FOLDER_LOCATION):
+def ensure_folder_exists(folder):
+    """Create a folder if it is missing, returning whether it exists."""
+    if not os.path.exists(folder):
         try:
             # Try to create as current user if possible
             import pwd
             uid = pwd.getpwnam(os.getlogin()).pw_uid
-            os.makedirs(FOLDER_LOCATION, exist_ok=True)
-            os.chown(FOLDER_LOCATION, uid, -1)
+            os.makedirs(folder, exist_ok=True)
+            os.chown(folder, uid, -1)
         except Exception as e:
             print(f"Error creating directory: {e}")
-            return []
-    
-    files = []
-    try:
-        for root, _, filenames in os.walk(FOLDER_LOCATION):
-            for filename in filenames:
-                if filename.lower().endswith(f".{FORMAT_FROM.lower()}"):
-                    files.append(os.path.join(root, filename))
-    except (PermissionError, OSError) as e:
-        print(f"Error accessing directory: {e}")
-    
+            return False
+    return True
+
+def get_extension_map(formats):
+    """Map each file extension of the given formats, with its leading dot, to its format."""
+    extensions = {}
+    for source_format in formats:
+        for alias in EXTENSION_ALIASES.get(source_format, [source_format.lower()]):
+            extensions[f".{alias}"] = source_format
+    return extensions
+
+def sniff_format(path, buffer):
+    """Identify a file's format from its leading bytes, read into a reused buffer, or None."""
+    try:
+        with open(path, "rb", buffering=0) as f:
+            length = f.readinto(buffer)
+    except OSError:
+        return None
+    head = memoryview(buffer)[:length]
+    for source_format, offset, magic in SNIFF_SIGNATURES:
+        if head[offset:offset + len(magic)] == magic:
+            return source_format
+    return None
+
+def remove_stale_temp(entry):
+    """Remove a temp output a killed run left behind; recent ones may belong to a conversion in progress."""
+    try:
+        if time.time() - entry.stat(follow_symlinks=False).st_mtime > STALE_TEMP_AGE:
+            os.remove(entry.path)
+    except OSError:
+        pass
+
+def iter_files_to_convert(spec, folder=None):
+    """Yield (path, source_format) for files of any source format in one scan of the folder tree."""
+    selected = set(spec.format_from)
+    # Sniffing looks at every image file, since its extension may be wrong
+    extensions = get_extension_map(ALLOWED_FORMATS + list(spec.format_from) if spec.sniff_formats else spec.format_from)
+    buffer = bytearray(SNIFF_BYTES)
+    pending_dirs = [folder or spec.folder_location]
+    while pending_dirs:
+        current_dir = pending_dirs.pop()
+        try:
+            with os.scandir(current_dir) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending_dirs.append(entry.path)
+                            continue
+                        # Temp outputs are never sources, even when their format is selected
+                        if TEMP_OUTPUT_SUFFIX in entry.name:
+                            remove_stale_temp(entry)
+                            continue
+                        source_format = extensions.get(os.path.splitext(entry.name)[1].lower())
+                        if not source_format or not entry.is_file():
+                            continue
+                        if spec.sniff_formats:
+                            source_format = sniff_format(entry.path, buffer) or source_format
+                        if source_format in selected:
+                            yield entry.path, source_format
+                    except OSError:
+                        continue
+        except (PermissionError, OSError) as e:
+            print(f"Error accessing directory: {e}")
+
+def find_files_to_convert(spec):
+    """Find all files of the source formats in the specified folder, as lists per format."""
+    if not ensure_folder_exists(spec.folder_location):
+        return {}
+    files = {source_format: [] for source_format in spec.format_from}
+    for input_file, source_format in iter_files_to_convert(spec):
+        files[source_format].append(input_file)
     return files
 
-def start_conversion():
-    """Execute the conversion process using nconvert."""
-    global FILES_PROCESS_DONE, FILES_PROCESS_TOTAL
+def get_conversion_options(spec, target_format):
+    """Return the nconvert options that shape an output, shared by every run."""
+    return ["-out", target_format.lower(), *CONVERSION_PRESETS[spec.preset]]
+
+def get_target_label(spec):
+    """Return the target formats as one label, e.g. for learned stats and log records."""
+    return "+".join(spec.format_to)
+
+def get_backend(spec, source_format, target_format):
+    """Return the backend that converts one format pair under a spec's settings."""
+    if spec.backend == "NConvert" or source_format not in PILLOW_FORMATS or target_format not in PILLOW_FORMATS:
+        return "NConvert"
+    # Pillow has to be installed and able to reproduce every operation of the preset
+    if not is_pillow_available() or parse_preset(CONVERSION_PRESETS[spec.preset]) is None:
+        return "NConvert"
+    return BACKEND_OVERRIDES.get(f"{source_format}->{target_format}", "Pillow")
+
+def get_file_backend(spec, source_format):
+    """Return the backend for files of a source format; Pillow only when it handles every target."""
+    if all(get_backend(spec, source_format, target_format) == "Pillow" for target_format in spec.format_to):
+        return "Pillow"
+    return "NConvert"
+
+def get_output_file(input_file, target_format):
+    """Return the output path for an input file in a target format."""
+    base_name = input_file.rsplit('.', 1)[0]
+    return f"{base_name}.{target_format.lower()}"
+
+def get_output_files(spec, input_file):
+    """Return the output paths for an input file in every target format."""
+    return [get_output_file(input_file, target_format) for target_format in spec.format_to]
+
+def get_temp_output_file(input_file, target_format, attempt=""):
+    """Return the name an output is written to before it is renamed into place."""
+    base_name = input_file.rsplit('.', 1)[0]
+    return f"{base_name}{TEMP_OUTPUT_SUFFIX}{attempt}.{target_format.lower()}"
+
+def sync_directory(folder):
+    """Flush a directory's entries, making renames in it durable."""
+    fd = os.open(folder, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def finalize_output(spec, input_file, attempt=""):
+    """Move finished temp outputs into place, syncing them first when originals will be deleted."""
+    for target_format in spec.format_to:
+        temp_file = get_temp_output_file(input_file, target_format, attempt)
+        if spec.delete_files_after:
+            with open(temp_file, "rb") as f:
+                os.fsync(f.fileno())
+        os.replace(temp_file, get_output_file(input_file, target_format))
+
+def remove_temp_output(spec, input_file, attempt=""):
+    """Remove partial temp outputs left by a failed conversion."""
+    for target_format in spec.format_to:
+        try:
+            os.remove(get_temp_output_file(input_file, target_format, attempt))
+        except OSError:
+            pass
+
+def verify_output(output_file, target_format):
+    """Check an output exists, is non-empty and starts with a signature of its format."""
+    signatures = FORMAT_MAGIC.get(target_format, [])
+    try:
+        with open(output_file, "rb") as f:
+            head = f.read(max([offset + len(magic) for offset, magic in signatures], default=1))
+    except OSError:
+        return False
+    if not head:
+        return False
+    return not signatures or any(head[offset:offset + len(magic)] == magic for offset, magic in signatures)
+
+def delete_original(spec, input_file):
+    """Delete an original once its output is verified, returning an error message or ''."""
+    for target_format in spec.format_to:
+        if not verify_output(get_output_file(input_file, target_format), target_format):
+            return f"{target_format} output failed verification; original kept"
+    try:
+        os.remove(input_file)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        return str(e)
+    return ""
+
+def load_json(path, default):
+    """Load a JSON state file, returning default if it is missing or unreadable."""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+def save_json(path, data):
+    """Atomically write a JSON state file."""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(temp_path, path)
+    except OSError as e:
+        print(f"Error saving {os.path.basename(path)}: {e}")
+
+def load_fingerprints():
+    """Load stored fingerprints, keyed by output path."""
+    return load_json(FINGERPRINTS_PATH, {})
+
+def save_fingerprints(updates):
+    """Merge a run's fingerprint changes into the stored ones, keeping other runs' changes; None removes one."""
+    with FINGERPRINTS_LOCK:
+        fingerprints = load_fingerprints()
+        for output_file, fingerprint in updates.items():
+            if fingerprint is None:
+                fingerprints.pop(output_file, None)
+            else:
+                fingerprints[output_file] = fingerprint
+        save_json(FINGERPRINTS_PATH, fingerprints)
+
+def load_format_stats():
+    """Load learned per-format statistics into FORMAT_STATS, once per process."""
+    global FORMAT_STATS
+    with FORMAT_STATS_LOCK:
+        if FORMAT_STATS is None:
+            FORMAT_STATS = load_json(FORMAT_STATS_PATH, {})
+            FORMAT_STATS.setdefault("throughput", {})
+            FORMAT_STATS.setdefault("pixel_throughput", {})
+            FORMAT_STATS.setdefault("output_ratio", {})
+    return FORMAT_STATS
+
+def save_format_stats():
+    """Persist learned per-format statistics."""
+    with FORMAT_STATS_LOCK:
+        save_json(FORMAT_STATS_PATH, FORMAT_STATS)
+
+def get_throughput_key(spec, source_format, backend=None):
+    """Return the key throughput is learned under; Pillow conversions get their own."""
+    backend = backend or get_file_backend(spec, source_format)
+    return source_format if backend == "NConvert" else f"{source_format} ({backend})"
+
+def record_throughput(spec, source_format, input_bytes, exec_time, pixels=0, backend=None):
+    """Fold a successful conversion into the format's smoothed byte and pixel throughput."""
+    if input_bytes < THROUGHPUT_MIN_SAMPLE_BYTES or exec_time <= 0.01:
+        return
+    stats_key = get_throughput_key(spec, source_format, backend)
+    samples = [("throughput", input_bytes / exec_time)]
+    if pixels:
+        samples.append(("pixel_throughput", pixels / exec_time))
+    # Other runs may be saving the stats; json.dump fails if a key is added meanwhile
+    with FORMAT_STATS_LOCK:
+        for key, sample in samples:
+            throughput = FORMAT_STATS[key]
+            previous = throughput.get(stats_key)
+            throughput[stats_key] = sample if previous is None else (
+                previous + THROUGHPUT_SMOOTHING * (sample - previous))
+
+def get_output_ratio_key(spec, source_format):
+    """Return the key output ratios are learned under; presets that resize get their own."""
+    key = f"{source_format}->{get_target_label(spec)}"
+    return key if spec.preset == "None" else f"{key} ({spec.preset})"
+
+def record_output_ratio(spec, source_format, input_bytes, output_bytes):
+    """Fold a successful conversion into the format pair's smoothed output/input size ratio."""
+    if input_bytes <= 0 or output_bytes <= 0:
+        return
+    pair = get_output_ratio_key(spec, source_format)
+    sample = output_bytes / input_bytes
+    with FORMAT_STATS_LOCK:
+        ratios = FORMAT_STATS["output_ratio"]
+        previous = ratios.get(pair)
+        ratios[pair] = sample if previous is None else previous + THROUGHPUT_SMOOTHING * (sample - previous)
+
+def estimate_output(spec, input_bytes, header, source_format=None):
+    """Estimate a file's output size from the learned ratio, else its decoded size."""
+    ratio = FORMAT_STATS["output_ratio"].get(get_output_ratio_key(spec, source_format))
+    if ratio is not None:
+        return int(input_bytes * ratio)
+    if header:
+        return estimate_decoded_bytes(header)
+    return int(input_bytes * DEFAULT_OUTPUT_RATIO)
+
+def get_disk_headroom(spec, in_flight_output):
+    """Return the bytes new outputs may use before the output filesystem reaches its reserve."""
+    try:
+        stat = os.statvfs(spec.folder_location)
+    except OSError:
+        return float("inf")
+    return stat.f_bavail * stat.f_frsize - spec.disk_reserve_mb * 1048576 - in_flight_output
+
+def estimate_cost(spec, input_bytes, pixels=0, source_format=None):
+    """Estimate seconds to convert a file from its pixel count or size and learned throughput."""
+    stats_key = get_throughput_key(spec, source_format)
+    if pixels:
+        pixel_throughput = FORMAT_STATS["pixel_throughput"].get(stats_key, DEFAULT_PIXEL_THROUGHPUT)
+        return ESTIMATED_STARTUP_COST + pixels / max(pixel_throughput, 1.0)
+    throughput = FORMAT_STATS["throughput"].get(stats_key, DEFAULT_THROUGHPUT)
+    return ESTIMATED_STARTUP_COST + input_bytes / max(throughput, 1.0)
+
+def estimate_memory(input_bytes, header):
+    """Estimate peak memory for converting a file, from its probed header when available."""
+    decoded = estimate_decoded_bytes(header) if header else input_bytes * UNKNOWN_MEMORY_PER_BYTE
+    return int(decoded * MEMORY_OVERHEAD_FACTOR)
+
+def get_memory_headroom(spec, in_flight_memory):
+    """Return the memory still available to new conversions, in bytes."""
+    headroom = float("inf")
+    if spec.memory_budget_mb > 0:
+        headroom = spec.memory_budget_mb * 1048576 - in_flight_memory
+    # Live backstop: estimates can be wrong and other programs use memory too
+    if psutil is not None:
+        headroom = min(headroom, psutil.virtual_memory().available - MEMORY_RESERVE_MB * 1048576)
+    return headroom
+
+def get_timeout(spec, input_bytes, source_format=None, files=1):
+    """Return a timeout for converting input_bytes in files, from the format's learned throughput."""
+    throughput = FORMAT_STATS["throughput"].get(get_throughput_key(spec, source_format), DEFAULT_THROUGHPUT)
+    # Each file of a batch has its own fixed cost, however small it is
+    work = files * ESTIMATED_STARTUP_COST + input_bytes / max(throughput, 1.0)
+    timeout = TIMEOUT_MIN + TIMEOUT_SAFETY_FACTOR * work
+    return min(timeout, TIMEOUT_MAX)
+
+def get_fingerprint(input_file, output_file):
+    """Return the size/mtime fingerprint of a source and its output."""
+    source = os.stat(input_file)
+    output = os.stat(output_file)
+    return [source.st_size, source.st_mtime_ns, output.st_size, output.st_mtime_ns]
+
+def is_up_to_date(spec, input_file, fingerprints):
+    """Check whether every output of a file is newer than its source, or matches its fingerprint."""
+    try:
+        source = os.stat(input_file)
+        for output_file in get_output_files(spec, input_file):
+            if spec.incremental_mode == "Fingerprint":
+                if fingerprints.get(output_file) != get_fingerprint(input_file, output_file):
+                    return False
+                continue
+            output = os.stat(output_file)
+            if output.st_size == 0 or output.st_mtime_ns < source.st_mtime_ns:
+                return False
+        return True
+    except OSError:
+        return False
+
+def hash_file(path, limit=None):
+    """Return a BLAKE2b digest of a file's content, or of its first limit bytes."""
+    digest = hashlib.blake2b(digest_size=20)
+    remaining = limit
+    with open(path, "rb") as f:
+        while remaining is None or remaining > 0:
+            chunk = f.read(1048576 if remaining is None else min(1048576, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return digest.hexdigest()
+
+class DuplicateFinder:
+    """Finds byte-identical files by size first, then a quick partial hash, then a full hash."""
+
+    def __init__(self):
+        # First file seen per size, per (size, quick hash) and per (size, full hash)
+        self.by_size = {}
+        self.by_quick_hash = {}
+        self.by_full_hash = {}
+        self.hashes = {}
+
+    def get_hash(self, path, size, full):
+        """Return a cached quick or full hash; files within the quick range only need one."""
+        key = (path, full and size > QUICK_HASH_BYTES)
+        if key not in self.hashes:
+            self.hashes[key] = hash_file(path, None if key[1] else QUICK_HASH_BYTES)
+        return self.hashes[key]
+
+    def index(self, index, path, size, full):
+        """Add an earlier file to a hash index, unless another has its hash; unreadable files are left out."""
+        try:
+            index.setdefault((size, self.get_hash(path, size, full)), path)
+        except OSError:
+            pass
+
+    def find(self, path, size):
+        """Return an earlier file with identical content, or remember this one and return None."""
+        # A file is only hashed once another of its size (or quick hash) turns up
+        first = self.by_size.setdefault(size, path)
+        if first == path:
+            return None
+        self.index(self.by_quick_hash, first, size, False)
+        try:
+            candidate = self.by_quick_hash.setdefault((size, self.get_hash(path, size, False)), path)
+            if candidate == path:
+                return None
+            self.index(self.by_full_hash, candidate, size, True)
+            match = self.by_full_hash.setdefault((size, self.get_hash(path, size, True)), path)
+        except OSError:
+            return None
+        return None if match == path else match
+
+def link_output(source, destination, allow_hardlink=True, durable=False):
+    """Give destination the content of source by reflink, hardlink or copy; returns the method."""
+    temp_path = f"{destination}.link-tmp"
+    try:
+        try:
+            # Reflinks share blocks copy-on-write, so the files stay independent
+            with open(source, "rb") as src, open(temp_path, "wb") as dst:
+                fcntl.ioctl(dst.fileno(), 0x40049409, src.fileno())  # FICLONE
+            method = "reflink"
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            try:
+                if not allow_hardlink:
+                    raise OSError("hardlink not allowed")
+                os.link(source, temp_path)
+                method = "hardlink"
+            except OSError:
+                shutil.copy2(source, temp_path)
+                method = "copy"
+        # An original may be deleted right after, so the output has to be on disk first
+        if durable:
+            with open(temp_path, "rb") as f:
+                os.fsync(f.fileno())
+        os.replace(temp_path, destination)
+        if durable:
+            sync_directory(os.path.dirname(destination) or ".")
+        return method
+    except OSError:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+def link_duplicate(spec, input_file, primary_file, primary_result):
+    """Produce a duplicate's output from its primary's converted output."""
+    if not primary_result["success"]:
+        return make_result(spec, input_file, False, f"Identical to {os.path.basename(primary_file)}, which failed", "Failed")
+    started = time.monotonic()
+    try:
+        for target_format in spec.format_to:
+            method = link_output(get_output_file(primary_file, target_format), get_output_file(input_file, target_format),
+                                 durable=spec.delete_files_after)
+    except OSError as e:
+        return make_result(spec, input_file, False, str(e), "Error", started=started)
+    return make_result(spec, input_file, True, "", "Deduplicated", started=started,
+                       exec_time=time.monotonic() - started, link_method=method,
+                       cpu_saved=primary_result["cpu_time"])
+
+def kill_process_group(process, sig=signal.SIGKILL):
+    """Signal an nconvert process and anything it spawned."""
+    try:
+        os.killpg(process.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def run_nconvert(run, command, timeout, cwd=None):
+    """Run nconvert in its own process group, returning (returncode, stderr, cpu_time)."""
+    process = subprocess.Popen(
+        command,
+        cwd=cwd,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        start_new_session=True
+    )
+    with run.processes_lock:
+        run.processes.add(process)
+    timed_out = threading.Event()
+
+    def on_timeout():
+        timed_out.set()
+        kill_process_group(process)
+
+    timer = threading.Timer(timeout, on_timeout)
+    timer.start()
+    try:
+        # A cancel may have arrived between the caller's check and registration
+        if run.cancelled.is_set():
+            kill_process_group(process)
+        stderr = process.stderr.read()
+        process.stderr.close()
+
+        # Reap with wait4 so the child's own CPU usage is known
+        cpu_time = 0.0
+        try:
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            cpu_time = usage.ru_utime + usage.ru_stime
+        except ChildProcessError:
+            process.wait()
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(command, timeout)
+        return process.returncode, stderr, cpu_time
+    finally:
+        timer.cancel()
+        with run.processes_lock:
+            run.processes.discard(process)
+
+def cancel_conversion(run):
+    """Stop a conversion in progress and terminate its nconvert processes."""
+    run.cancelled.set()
+    with run.processes_lock:
+        processes = list(run.processes)
+    for process in processes:
+        kill_process_group(process, signal.SIGTERM)
+
+    # Give nconvert a moment to exit cleanly before forcing it; workers reap it
+    deadline = time.monotonic() + CANCEL_GRACE_PERIOD
+    while time.monotonic() < deadline:
+        with run.processes_lock:
+            if not run.processes.intersection(processes):
+                break
+        time.sleep(0.05)
+    with run.processes_lock:
+        remaining = run.processes.intersection(processes)
+    for process in remaining:
+        kill_process_group(process)
+    return len(processes)
+
+def get_file_size(path):
+    """Return a file's size in bytes, or 0 if it cannot be read."""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def add_cpu_time(total, step_cpu_time):
+    """Add a step's CPU seconds to a total; None, for unmeasured, spoils the total."""
+    return None if total is None or step_cpu_time is None else total + step_cpu_time
+
+def make_result(spec, input_file, success, error="", label="Converted", **stats):
+    """Build the result record for one file."""
+    result = {
+        "input_file": input_file,
+        "success": success,
+        "error": error,
+        "label": label,
+        "started": time.monotonic(),
+        "exec_time": 0.0,
+        "cpu_time": 0.0,
+        "exit_status": None,
+        "batch_size": 1,
+        "attempts": 1,
+        "backend": None,
+        "input_bytes": get_file_size(input_file),
+        "output_bytes": sum(get_file_size(output_file) for output_file in get_output_files(spec, input_file)) if success else 0
+    }
+    result.update(stats)
+    return result
+
+def should_retry(run, result, attempt):
+    """Decide whether a failed attempt is retried under the run's retry policy."""
+    if result["success"] or attempt >= run.spec.retry_max_attempts or run.cancelled.is_set():
+        return False
+    if run.spec.retry_on_timeout_only:
+        return result["label"] == "Timeout"
+    return result["label"] in ("Timeout", "Failed", "Error")
+
+def convert_file_steps(run, input_file, source_format=None):
+    """Steps converting a single file under the retry policy, returning its result record."""
+    timeout = get_timeout(run.spec, get_file_size(input_file), source_format)
+    backend = get_file_backend(run.spec, source_format)
+    attempt = 1
+    while True:
+        result = yield from convert_file_once_steps(run, input_file, timeout, backend)
+        if not should_retry(run, result, attempt):
+            result["attempts"] = attempt
+            return result
+        # Back off exponentially; a timed out file gets a longer limit next time
+        if result["label"] == "Timeout":
+            timeout = min(timeout * 2, TIMEOUT_MAX)
+        yield ("wait", run.spec.retry_backoff * 2 ** (attempt - 1))
+        attempt += 1
+
+def get_intermediate_file(input_file, intermediate_dir):
+    """Return the lossless intermediate a source is decoded to when there are several targets."""
+    base_name = os.path.splitext(os.path.basename(input_file))[0]
+    return os.path.join(intermediate_dir, f"{base_name}.{INTERMEDIATE_FORMAT.lower()}")
+
+def get_pillow_pool():
+    """Return the Pillow process pool, starting it on first use."""
+    global PILLOW_POOL
+    with PILLOW_POOL_LOCK:
+        if PILLOW_POOL is None:
+            # Spawned workers don't inherit the engine's threads and locks; they start on demand,
+            # so sizing the pool for the largest worker count costs nothing
+            PILLOW_POOL = ProcessPoolExecutor(max_workers=MAX_WORKER_COUNT,
+                                              mp_context=multiprocessing.get_context("spawn"))
+        return PILLOW_POOL
+
+def reset_pillow_pool(pool):
+    """Drop a broken pool so the next conversion starts a fresh one."""
+    global PILLOW_POOL
+    with PILLOW_POOL_LOCK:
+        if PILLOW_POOL is pool:
+            PILLOW_POOL = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def convert_file_pillow(run, input_file, timeout):
+    """Run one conversion attempt on the Pillow process pool, returning its result record."""
+    spec = run.spec
+    started = time.monotonic()
+    # An abandoned attempt may still be writing, so each attempt writes to its own temp names
+    attempt = f"-{next(PILLOW_ATTEMPT_SEQUENCE)}"
+    outputs = [(get_temp_output_file(input_file, target_format, attempt), target_format)
+               for target_format in spec.format_to]
+    pool = get_pillow_pool()
+    try:
+        future = pool.submit(convert_image, input_file, outputs, parse_preset(CONVERSION_PRESETS[spec.preset]))
+        while True:
+            try:
+                cpu_time = future.result(timeout=0.2)
+                break
+            except FutureTimeoutError:
+                if run.cancelled.is_set():
+                    label, error = "Cancelled", "Cancelled"
+                elif time.monotonic() - started >= timeout:
+                    label, error = "Timeout", f"Conversion timeout after {timeout:.1f}s"
+                else:
+                    continue
+                # A running conversion can't be interrupted; its outputs are removed once it ends
+                if not future.cancel():
+                    future.add_done_callback(lambda _: remove_temp_output(spec, input_file, attempt))
+                return make_result(spec, input_file, False, error, label, started=started,
+                                   exec_time=time.monotonic() - started, backend="Pillow")
+    except BrokenProcessPool as e:
+        reset_pillow_pool(pool)
+        remove_temp_output(spec, input_file, attempt)
+        return make_result(spec, input_file, False, str(e), "Failed", started=started, backend="Pillow")
+    except Exception as e:
+        remove_temp_output(spec, input_file, attempt)
+        return make_result(spec, input_file, False, str(e) or type(e).__name__, "Failed", started=started,
+                           exec_time=time.monotonic() - started, backend="Pillow")
+
+    # Failing to put outputs in place fails the file, not the run
+    try:
+        finalize_output(spec, input_file, attempt)
+        if spec.delete_files_after:
+            sync_directory(os.path.dirname(input_file))
+    except OSError as e:
+        remove_temp_output(spec, input_file, attempt)
+        return make_result(spec, input_file, False, str(e), "Error", started=started,
+                           exec_time=time.monotonic() - started, backend="Pillow")
+    return make_result(spec, input_file, True, started=started, exec_time=time.monotonic() - started,
+                       cpu_time=cpu_time, exit_status=0, backend="Pillow")
+
+def get_intermediate_dir(spec):
+    """Create a tmpfs directory for lossless intermediates when there are several targets, else None."""
+    if len(spec.format_to) > 1:
+        return tempfile.mkdtemp(prefix="nconvert_", dir=INTERMEDIATE_DIR)
+    return None
+
+def get_file_commands(spec, input_file, intermediate_dir):
+    """Return the nconvert commands converting one file; several targets share one decode."""
+    commands = []
+    source_file = input_file
+    if intermediate_dir:
+        source_file = get_intermediate_file(input_file, intermediate_dir)
+        commands.append([NCONVERT_PATH, "-out", INTERMEDIATE_FORMAT.lower(), "-overwrite", "-o", source_file, input_file])
+
+    # nconvert writes to temp names; only finished outputs are renamed into place
+    for target_format in spec.format_to:
+        commands.append([
+            NCONVERT_PATH,
+            *get_conversion_options(spec, target_format),
+            "-overwrite",
+            "-o", get_temp_output_file(input_file, target_format),
+            source_file
+        ])
+    return commands
+
+def get_attempt_result(run, input_file, returncode, stderr, stats):
+    """Put a finished single-file attempt's outputs in place or clean them up, returning its result record."""
+    spec = run.spec
+    stats = dict(stats, exit_status=returncode, backend="NConvert")
+    if returncode == 0:
+        finalize_output(spec, input_file)
+        if spec.delete_files_after:
+            sync_directory(os.path.dirname(input_file))
+        return make_result(spec, input_file, True, **stats)
+    remove_temp_output(spec, input_file)
+    if run.cancelled.is_set():
+        return make_result(spec, input_file, False, "Cancelled", "Cancelled", **stats)
+    error_message = stderr.strip() if stderr else "Unknown error occurred"
+    return make_result(spec, input_file, False, error_message, "Failed", **stats)
+
+def convert_file_once_steps(run, input_file, timeout, backend="NConvert"):
+    """Steps of one conversion attempt for a single file, returning its result record."""
+    spec = run.spec
+    if run.cancelled.is_set():
+        return make_result(spec, input_file, False, "Cancelled", "Cancelled")
+    if backend == "Pillow":
+        result = yield ("call", convert_file_pillow, run, input_file, timeout)
+        # Files Pillow can't read or write are handed to nconvert
+        if result["label"] != "Failed":
+            return result
+    started = time.monotonic()
+    intermediate_dir = None
+    try:
+        # With several targets the source is decoded once, to a lossless intermediate on tmpfs
+        intermediate_dir = get_intermediate_dir(spec)
+
+        # Execute conversion, stopping at the first failed step
+        cpu_time = 0.0
+        for command in get_file_commands(spec, input_file, intermediate_dir):
+            returncode, stderr, step_cpu_time = yield ("nconvert", command, timeout, None)
+            cpu_time = add_cpu_time(cpu_time, step_cpu_time)
+            if returncode != 0:
+                break
+        return (yield ("call", get_attempt_result, run, input_file, returncode, stderr,
+                       {"started": started, "exec_time": time.monotonic() - started, "cpu_time": cpu_time}))
+
+    except subprocess.TimeoutExpired:
+        remove_temp_output(spec, input_file)
+        return make_result(spec, input_file, False, f"Conversion timeout after {timeout:.1f}s", "Timeout",
+                           started=started, exec_time=time.monotonic() - started, backend="NConvert")
+    except Exception as e:
+        remove_temp_output(spec, input_file)
+        return make_result(spec, input_file, False, str(e), "Error", started=started, backend="NConvert")
+    finally:
+        if intermediate_dir:
+            shutil.rmtree(intermediate_dir, ignore_errors=True)
+
+def write_list_file(paths):
+    """Write paths to a temporary nconvert list file, returning its path."""
+    with tempfile.NamedTemporaryFile("w", suffix=".lst", delete=False) as list_file:
+        list_file.write("\n".join(paths) + "\n")
+        return list_file.name
+
+def get_batch_commands(spec, input_files, intermediate_dir, temp_paths):
+    """Return the (command, cwd) steps converting a batch; list files written are added to temp_paths."""
+    folder = os.path.dirname(input_files[0])
+    list_path = write_list_file(input_files)
+    temp_paths.append(list_path)
+    steps = []
+
+    # With several targets the batch is decoded once, to lossless intermediates on tmpfs
+    if intermediate_dir:
+        steps.append(([
+            NCONVERT_PATH,
+            "-out", INTERMEDIATE_FORMAT.lower(),
+            "-overwrite",
+            "-o", f"%.{INTERMEDIATE_FORMAT.lower()}",
+            "-l", list_path
+        ], intermediate_dir))
+        list_path = write_list_file([get_intermediate_file(input_file, intermediate_dir) for input_file in input_files])
+        temp_paths.append(list_path)
+
+    # Outputs are named from the source name via the '%' template, relative to the folder
+    for target_format in spec.format_to:
+        steps.append(([
+            NCONVERT_PATH,
+            *get_conversion_options(spec, target_format),
+            "-overwrite",
+            "-o", f"%{TEMP_OUTPUT_SUFFIX}.{target_format.lower()}",
+            "-l", list_path
+        ], folder))
+    return steps
+
+def remove_batch_files(temp_paths, intermediate_dir):
+    """Remove a batch's list files and intermediates."""
+    for temp_path in temp_paths:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+    if intermediate_dir:
+        shutil.rmtree(intermediate_dir, ignore_errors=True)
+
+def collect_batch_results(spec, input_files, started, started_wall, returncode, cpu_time, interrupted):
+    """Map a batch run back to its files, returning (results, files to retry singly)."""
+    # A killed, timed out or cancelled batch may have left truncated outputs that still look valid
+    if interrupted:
+        for input_file in input_files:
+            remove_temp_output(spec, input_file)
+        return [], list(input_files)
+
+    # Batch cost is shared evenly between its files
+    share = len(input_files)
+    stats = {
+        "started": started,
+        "exec_time": (time.monotonic() - started) / share,
+        "cpu_time": cpu_time / share if cpu_time is not None else None,
+        "exit_status": returncode,
+        "batch_size": share,
+        "backend": "NConvert"
+    }
+
+    # nconvert finished every file it could; one is converted when every target has a fresh, valid temp output
+    results = []
+    retry_files = []
+    for input_file in input_files:
+        try:
+            converted = True
+            for target_format in spec.format_to:
+                temp_file = get_temp_output_file(input_file, target_format)
+                converted = (converted and os.stat(temp_file).st_mtime >= started_wall
+                             and verify_output(temp_file, target_format))
+            if converted:
+                finalize_output(spec, input_file)
+        except OSError:
+            converted = False
+        if converted:
+            results.append(make_result(spec, input_file, True, **stats))
+        else:
+            remove_temp_output(spec, input_file)
+            retry_files.append(input_file)
+    if spec.delete_files_after:
+        try:
+            sync_directory(os.path.dirname(input_files[0]))
+        except OSError:
+            pass
+    return results, retry_files
+
+def convert_batch_steps(run, input_files, source_format=None):
+    """Steps converting files of one format and folder in a single nconvert run, retrying failures singly."""
+    temp_paths = []
+    intermediate_dir = None
+    started = time.monotonic()
+    started_wall = int(time.time())
+    returncode = None
+    cpu_time = 0.0
+    interrupted = True
+    try:
+        timeout = get_timeout(run.spec, sum(get_file_size(input_file) for input_file in input_files), source_format,
+                              len(input_files))
+        intermediate_dir = get_intermediate_dir(run.spec)
+        killed = False
+        for command, cwd in get_batch_commands(run.spec, input_files, intermediate_dir, temp_paths):
+            step_returncode, _, step_cpu_time = yield ("nconvert", command, timeout, cwd)
+            cpu_time = add_cpu_time(cpu_time, step_cpu_time)
+            # nconvert exits non-zero when any file failed and goes on with the rest; only a signal cuts it short
+            returncode = returncode or step_returncode
+            if step_returncode < 0:
+                killed = True
+                break
+        interrupted = killed or run.cancelled.is_set()
+    except Exception as e:
+        # Every file of the batch is retried singly below
+        print(f"Batch conversion in {os.path.dirname(input_files[0])} failed: {e}")
+    finally:
+        remove_batch_files(temp_paths, intermediate_dir)
+
+    results, retry_files = yield ("call", collect_batch_results, run.spec, input_files, started, started_wall,
+                                  returncode, cpu_time, interrupted)
+    # Retries run one after another, within the one shared process slot the batch holds
+    for input_file in retry_files:
+        results.append((yield from convert_file_steps(run, input_file, source_format)))
+    return results
+
+def fetch_cached(run, input_file, source_format=None):
+    """Look up a file's outputs in the conversion cache, returning (keys by target, result or None)."""
+    started = time.monotonic()
+    try:
+        input_hash = hash_file(input_file)
+    except OSError:
+        return None, None
+    # Outputs of each backend differ, so each is cached under its own identity
+    spec = run.spec
+    if get_file_backend(spec, source_format) == "Pillow":
+        backend_id = f"pillow-{get_pillow_version()}"
+    else:
+        backend_id = get_nconvert_id(NCONVERT_PATH)
+    keys = {target_format: get_cache_key(input_hash, target_format, get_conversion_options(spec, target_format), backend_id)
+            for target_format in spec.format_to}
+    cached_paths = {target_format: cache_lookup(key) for target_format, key in keys.items()}
+    # Every target has to be cached, otherwise the file is converted as usual
+    if not all(cached_paths.values()):
+        run.count_cache("misses")
+        return keys, None
+    try:
+        # Never hardlink, so editing an output cannot corrupt the cached copy
+        for target_format, cached_path in cached_paths.items():
+            method = link_output(cached_path, get_output_file(input_file, target_format), allow_hardlink=False,
+                                 durable=spec.delete_files_after)
+    except OSError:
+        run.count_cache("misses")
+        return keys, None
+    run.count_cache("hits")
+    return keys, make_result(spec, input_file, True, "", "Cached", started=started,
+                             exec_time=time.monotonic() - started, link_method=method)
+
+def store_cached(run, keys, input_file):
+    """Copy a file's fresh outputs into the conversion cache."""
+    for target_format, key in keys.items():
+        cache_path = get_cache_path(key, target_format.lower())
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            link_output(get_output_file(input_file, target_format), cache_path, allow_hardlink=False)
+            cache_commit(key, cache_path)
+        except OSError as e:
+            print(f"Could not cache {os.path.basename(input_file)}: {e}")
+            return
+    run.count_cache("stored")
+
+def convert_files_steps(run, input_files, source_format=None):
+    """Steps converting a chunk of files, batching them when there is more than one."""
+    results = []
+    cache_keys = {}
+    if run.spec.use_cache:
+        for input_file in input_files:
+            key, result = yield ("call", fetch_cached, run, input_file, source_format)
+            if result:
+                results.append(result)
+            else:
+                cache_keys[input_file] = key
+        input_files = [input_file for input_file in input_files if input_file in cache_keys]
+
+    if len(input_files) > 1 and get_file_backend(run.spec, source_format) == "NConvert":
+        converted = yield from convert_batch_steps(run, input_files, source_format)
+    else:
+        converted = []
+        for input_file in input_files:
+            converted.append((yield from convert_file_steps(run, input_file, source_format)))
+    for result in converted:
+        key = cache_keys.get(result["input_file"])
+        if key and result["success"]:
+            yield ("call", store_cached, run, key, result["input_file"])
+    return results + converted
+
+# Both engines drive the same conversion steps. A step generator yields what it needs done:
+# ("nconvert", command, timeout, cwd) to run nconvert, ("wait", seconds) to back off, or
+# ("call", function, *args) for blocking work. It is sent the outcome back, or has the error thrown in.
+def perform_step(run, step):
+    """Carry out one conversion step on the calling thread."""
+    if step[0] == "nconvert":
+        return run_nconvert(run, step[1], timeout=step[2], cwd=step[3])
+    if step[0] == "wait":
+        run.cancelled.wait(step[1])
+        return None
+    return step[1](*step[2:])
+
+def run_steps(run, steps):
+    """Drive conversion steps to the end on the calling thread, returning their result."""
+    outcome = error = None
+    while True:
+        try:
+            step = steps.throw(error) if error else steps.send(outcome)
+        except StopIteration as stop:
+            return stop.value
+        outcome = error = None
+        try:
+            outcome = perform_step(run, step)
+        except Exception as e:
+            error = e
+
+def convert_files(run, input_files, source_format=None):
+    """Convert a chunk of files on a worker thread, returning their result records."""
+    return run_steps(run, convert_files_steps(run, input_files, source_format))
+
+async def run_nconvert_async(run, command, timeout, semaphore, cwd=None):
+    """Run nconvert as an asyncio subprocess in its own process group, returning (returncode, stderr, None)."""
+    async with semaphore:
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            cwd=cwd,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            start_new_session=True
+        )
+        with run.processes_lock:
+            run.processes.add(process)
+        try:
+            # A cancel may have arrived between the caller's check and registration
+            if run.cancelled.is_set():
+                kill_process_group(process)
+            try:
+                _, stderr = await asyncio.wait_for(process.communicate(), timeout)
+            except asyncio.TimeoutError:
+                kill_process_group(process)
+                await process.wait()
+                raise subprocess.TimeoutExpired(command, timeout)
+            # The event loop reaps its children itself, so their CPU time isn't known; None keeps
+            # it out of records and summaries rather than reporting it as zero
+            return process.returncode, stderr.decode(errors="replace"), None
+        finally:
+            with run.processes_lock:
+                run.processes.discard(process)
+
+async def sleep_unless_cancelled(run, seconds):
+    """Sleep on the event loop, waking early if the conversion is cancelled."""
+    deadline = time.monotonic() + seconds
+    while not run.cancelled.is_set() and time.monotonic() < deadline:
+        await asyncio.sleep(min(0.1, deadline - time.monotonic()))
+
+async def perform_step_async(run, step, semaphore):
+    """Carry out one conversion step on the event loop."""
+    if step[0] == "nconvert":
+        return await run_nconvert_async(run, step[1], step[2], semaphore, cwd=step[3])
+    if step[0] == "wait":
+        await sleep_unless_cancelled(run, step[1])
+        return None
+    # Blocking file I/O, hashing and Pillow waits are kept off the loop
+    return await asyncio.to_thread(step[1], *step[2:])
+
+async def run_steps_async(run, steps, semaphore):
+    """Drive conversion steps to the end on the event loop, returning their result."""
+    outcome = error = None
+    while True:
+        try:
+            step = steps.throw(error) if error else steps.send(outcome)
+        except StopIteration as stop:
+            return stop.value
+        outcome = error = None
+        try:
+            outcome = await perform_step_async(run, step, semaphore)
+        except Exception as e:
+            error = e
+
+async def convert_files_async(run, input_files, source_format, semaphore):
+    """Convert a chunk of files on the event loop, returning their result records."""
+    return await run_steps_async(run, convert_files_steps(run, input_files, source_format), semaphore)
+
+class AsyncioExecutor:
+    """Runs conversion coroutines on an event loop thread, with at most limit nconvert processes at once."""
+
+    def __init__(self, limit):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="conversion-loop", daemon=True)
+        self.thread.start()
+        self.semaphore = asyncio.run_coroutine_threadsafe(self.create_semaphore(limit), self.loop).result()
+        self.futures = set()
+
+    @staticmethod
+    async def create_semaphore(limit):
+        """Create the semaphore on the loop that uses it."""
+        return asyncio.Semaphore(limit)
+
+    def submit(self, coroutine_function, *args):
+        """Schedule a coroutine, passing the process semaphore last; returns a concurrent.futures.Future."""
+        future = asyncio.run_coroutine_threadsafe(coroutine_function(*args, self.semaphore), self.loop)
+        self.futures.add(future)
+        future.add_done_callback(self.futures.discard)
+        return future
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        # Like ThreadPoolExecutor, wait for submitted work before stopping
+        wait(list(self.futures))
+        asyncio.run_coroutine_threadsafe(self.loop.shutdown_default_executor(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+def scan_files(spec, file_queue, stop_event, fingerprints, completed=()):
+    """Scan for files on a background thread, feeding the bounded queue; completed files are skipped."""
+    probe_headers = spec.memory_budget_mb > 0 or spec.scheduling_policy == "Largest First"
+    duplicate_finder = DuplicateFinder() if spec.deduplicate else None
+    try:
+        for input_file, source_format in iter_files_to_convert(spec):
+            up_to_date = input_file in completed or (
+                spec.incremental_mode != "Off" and is_up_to_date(spec, input_file, fingerprints))
+            input_bytes = header = duplicate_of = None
+            if not up_to_date:
+                input_bytes = get_file_size(input_file)
+                if duplicate_finder and input_bytes > 0:
+                    duplicate_of = duplicate_finder.find(input_file, input_bytes)
+                if probe_headers and not duplicate_of:
+                    header = probe_image(input_file)
+            while not stop_event.is_set():
+                try:
+                    file_queue.put((input_file, source_format, up_to_date, input_bytes, header, duplicate_of), timeout=0.2)
+                    break
+                except queue.Full:
+                    continue
+            if stop_event.is_set():
+                return
+    finally:
+        # Sentinel marks the end of the scan
+        while not stop_event.is_set():
+            try:
+                file_queue.put(None, timeout=0.2)
+                break
+            except queue.Full:
+                continue
+
+class ConversionScheduler:
+    """Groups pending files into batches and hands them out, costliest first."""
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.largest_first = spec.scheduling_policy == "Largest First"
+        self.open_batches = {}
+        self.ready = []
+        self.sequence = 0
+        self.pending_files = 0
+
+    def add(self, input_file, input_bytes, header=None, source_format=None):
+        """Queue a discovered file, closing its folder and format's batch when full."""
+        batch_key = (os.path.dirname(input_file), source_format)
+        batch = self.open_batches.setdefault(batch_key, [[], 0.0, 0, 0, source_format])
+        pixels = header[0] * header[1] if header else 0
+        batch[0].append(input_file)
+        batch[1] += estimate_cost(self.spec, input_bytes, pixels, source_format)
+        # A batch decodes one file at a time, so it needs the memory of its largest file, unless
+        # several targets keep every file's intermediate in tmpfs until the batch is written
+        if len(self.spec.format_to) > 1:
+            batch[2] += estimate_memory(input_bytes, header)
+        else:
+            batch[2] = max(batch[2], estimate_memory(input_bytes, header))
+        # Its outputs all stay on disk, though
+        batch[3] += estimate_output(self.spec, input_bytes, header, source_format)
+        self.pending_files += 1
+        # Pillow has no process start-up to spread over a batch
+        batch_size = 1 if get_file_backend(self.spec, source_format) == "Pillow" else self.spec.batch_size
+        if len(batch[0]) >= batch_size:
+            self.push(*self.open_batches.pop(batch_key))
+
+    def push(self, files, cost, memory, output, source_format):
+        """Make a batch ready; the heap pops the highest cost, ties in discovery order."""
+        self.sequence += 1
+        priority = -cost if self.largest_first else 0
+        heapq.heappush(self.ready, (priority, self.sequence, files, memory, output, source_format))
+
+    def flush(self):
+        """Make every partially filled batch ready."""
+        for batch in self.open_batches.values():
+            self.push(*batch)
+        self.open_batches.clear()
+
+    def pop(self, memory_limit=None, disk_limit=None):
+        """Return (files, memory, output, source_format) of the next batch that fits both limits, or None."""
+        skipped = []
+        chosen = None
+        while self.ready and len(skipped) < SCHEDULER_FIT_CANDIDATES:
+            entry = heapq.heappop(self.ready)
+            if (memory_limit is None or entry[3] <= memory_limit) and (disk_limit is None or entry[4] <= disk_limit):
+                chosen = entry
+                break
+            # Too big for now; a smaller batch may fill the gap
+            skipped.append(entry)
+        for entry in skipped:
+            heapq.heappush(self.ready, entry)
+        if chosen is None:
+            return None
+        self.pending_files -= len(chosen[2])
+        return chosen[2:]
+
+    def clear(self):
+        """Drop all pending work."""
+        self.open_batches.clear()
+        self.ready.clear()
+        self.pending_files = 0
+
+def format_result_line(index, total, result):
+    """Format the log line for a finished conversion."""
+    line = f"[{index}/{total}] {result['label']}: {os.path.basename(result['input_file'])}"
+    if not result["success"] and result["label"] != "Cancelled":
+        line += f" - {result['error']}"
+    return line + "\n"
+
+def percentile(sorted_values, fraction):
+    """Return the nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(fraction * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def summarize_latencies(records):
+    """Return p50/p95/p99 conversion latency per source->target pair."""
+    latencies = {}
+    for record in records:
+        pair = f"{record['source_format']}->{record['target_format']} via {record['backend']}"
+        latencies.setdefault(pair, []).append(record["exec_time"])
+    summary = {}
+    for pair, values in latencies.items():
+        values.sort()
+        summary[pair] = {
+            "count": len(values),
+            "p50": percentile(values, 0.50),
+            "p95": percentile(values, 0.95),
+            "p99": percentile(values, 0.99)
+        }
+    return summary
+
+def create_run_log():
+    """Open a new append-only JSONL file for per-file run records."""
+    os.makedirs(LOGS_DIR, exist_ok=True)
+    # Concurrent runs can start in the same second
+    log_path = os.path.join(LOGS_DIR, f"run_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}_{next(RUN_LOG_SEQUENCE)}.jsonl")
+    return open(log_path, "a", encoding="utf-8")
+
+def format_duration(seconds):
+    """Format a duration in seconds as H:MM:SS."""
+    seconds = int(max(0, seconds))
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+def create_log_file():
+    """Open a new timestamped log file for a conversion run."""
+    os.makedirs(LOGS_DIR, exist_ok=True)
+    log_path = os.path.join(LOGS_DIR, f"conversion_{time.strftime('%Y%m%d_%H%M%S')}_{next(RUN_LOG_SEQUENCE)}.log")
+    return open(log_path, "w", encoding="utf-8")
+
+def iter_conversion(run):
+    """Run a conversion using a pool of nconvert workers, yielding log lines as they happen."""
+    try:
+        yield from iter_conversion_lines(run)
+    finally:
+        release_run_id(run.journal_id)
+
+def iter_conversion_lines(run):
+    """Yield the log lines of a conversion; its journal run stays claimed until iter_conversion ends."""
+    spec = run.spec
 
     # Validate nconvert
     if not os.path.isfile(NCONVERT_PATH):
-        return f"Error: nconvert not found at {NCONVERT_PATH}"
+        yield f"Error: nconvert not found at {NCONVERT_PATH}\n"
+        return
     
     if not os.access(NCONVERT_PATH, os.X_OK):
-        return f"Error: nconvert at {NCONVERT_PATH} is not executable"
+        yield f"Error: nconvert at {NCONVERT_PATH} is not executable\n"
+        return
 
-    if not os.path.exists(FOLDER_LOCATION):
-        return "Error: Please set a valid folder location."
-    
-    files = find_files_to_convert()
-    
-    if not files:
-        return f"No files with extension '{FORMAT_FROM}' found in {FOLDER_LOCATION}."
-    
-    FILES_PROCESS_DONE = 0
-    FILES_PROCESS_TOTAL = len(files)
+    if not os.path.exists(spec.folder_location) or not ensure_folder_exists(spec.folder_location):
+        yield "Error: Please set a valid folder location.\n"
+        return
+
+    skipped_count = 0
     conversion_results = []
-    status_message = f"Starting conversion of {FILES_PROCESS_TOTAL} files...\n"
-
-    for i, input_file in enumerate(files, 1):
-        try:
-            # Create output filename
-            base_name = input_file.rsplit('.', 1)[0]
-            output_file = f"{base_name}.{FORMAT_TO.lower()}"
-            
-            # Build nconvert command
-            command = [
-                NCONVERT_PATH,
-                "-out", FORMAT_TO.lower(),
-                "-overwrite",
-                "-o", output_file,
-                input_file
-            ]
-            
-            # Execute conversion
-            result = subprocess.run(
-                command,
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            
-            if result.returncode == 0:
-                FILES_PROCESS_DONE += 1
-                conversion_results.append((input_file, True, ""))
-                status_message += f"[{i}/{FILES_PROCESS_TOTAL}] Converted: {os.path.basename(input_file)}\n"
+    load_format_stats()
+    fingerprints = load_fingerprints() if spec.incremental_mode != "Off" else {}
+    # The asyncio engine sizes its window by in-flight count rather than threads; neither exceeds the shared cap
+    worker_count = min(spec.async_in_flight if spec.engine == "Asyncio" else spec.worker_count,
+                       MAX_NCONVERT_PROCESSES)
+
+    # Each run journals its files; a resumed run skips the files it already finished
+    completed = {}
+    try:
+        journal = RunJournal(JOURNAL_PATH)
+        if run.resume_run_id:
+            completed = {path: state for path, state in journal.resume_run(run.resume_run_id).items()
+                         if state in ("done", "deleted")}
+            yield f"Resuming run {run.resume_run_id}: {len(completed)} files were already converted.\n"
+        else:
+            # Claimed with the insert, so the new run is never offered for resuming meanwhile
+            with CLAIMED_RUN_IDS_LOCK:
+                run.journal_id = journal.start_run(get_settings(spec))
+                CLAIMED_RUN_IDS.add(run.journal_id)
+    except sqlite3.Error as e:
+        journal = None
+        print(f"Could not open run journal: {e}")
+    if spec.engine == "Asyncio":
+        yield (f"Starting conversion with up to {worker_count} nconvert processes on the asyncio engine "
+               f"while scanning {spec.folder_location}...\n")
+    else:
+        yield f"Starting conversion with {worker_count} workers while scanning {spec.folder_location}...\n"
+    # Every job draws on the same nconvert process slots, in proportion to its priority
+    SHARED_SCHEDULER.join(run, PRIORITY_WEIGHTS[spec.priority])
+    other_jobs = len(SHARED_SCHEDULER.get_runs()) - 1
+    if other_jobs:
+        yield (f"Sharing {MAX_NCONVERT_PROCESSES} nconvert processes with {other_jobs} other jobs "
+               f"at {spec.priority} priority.\n")
+    if spec.batch_size > 1:
+        yield f"Batching up to {spec.batch_size} files per nconvert run.\n"
+    if spec.backend != "NConvert":
+        pillow_formats = [source_format for source_format in spec.format_from
+                          if get_file_backend(spec, source_format) == "Pillow"]
+        if not is_pillow_available():
+            yield "Pillow is not installed; converting every file with nconvert.\n"
+        elif pillow_formats:
+            yield f"Converting {', '.join(pillow_formats)} with Pillow in-process; other formats use nconvert.\n"
+    if CONVERSION_PRESETS[spec.preset]:
+        yield f"Applying preset '{spec.preset}': {' '.join(CONVERSION_PRESETS[spec.preset])}\n"
+
+    # Discovery runs on its own thread so workers start on the first matches
+    file_queue = queue.Queue(maxsize=SCAN_QUEUE_SIZE)
+    stop_event = threading.Event()
+    scanner = threading.Thread(target=scan_files, args=(spec, file_queue, stop_event, fingerprints, completed), daemon=True)
+    scanner.start()
+
+    # Per-file timing records go to an append-only JSONL run log
+    try:
+        run_log = create_run_log()
+        yield f"Run log: {run_log.name}\n"
+    except OSError as e:
+        run_log = None
+        print(f"Could not create run log: {e}")
+    timing_records = []
+    queued_at = {}
+    file_pixels = {}
+    file_formats = {}
+    # Output paths claimed so far, so two sources never write the same output
+    claimed_outputs = {}
+    # Duplicates wait for their primary; finished primaries are kept for late duplicates
+    waiting_duplicates = {}
+    finished_primaries = {}
+    dedup_stats = {"files": 0, "bytes": 0, "cpu_time": 0.0}
+    processed = 0
+    streaming_delete = spec.delete_files_after and spec.delete_mode == "Streaming"
+    deleted_count = 0
+
+    def finish(result):
+        """Count, log and time one finished file, returning its log line."""
+        nonlocal processed, deleted_count
+        processed += 1
+        input_file = result["input_file"]
+        source_format = file_formats.pop(input_file, None)
+        if result["success"]:
+            run.done += 1
+        else:
+            run.failed += 1
+        conversion_results.append((input_file, result["success"], result["error"]))
+        record = {
+            "file": input_file,
+            "source_format": source_format,
+            "target_format": get_target_label(spec),
+            "status": result["label"],
+            "exit_status": result["exit_status"],
+            "queue_wait": max(0.0, result["started"] - queued_at.pop(input_file, result["started"])),
+            "exec_time": result["exec_time"],
+            "cpu_time": result["cpu_time"],
+            "input_bytes": result["input_bytes"],
+            "output_bytes": result["output_bytes"],
+            "batch_size": result["batch_size"],
+            "attempts": result["attempts"],
+            "backend": result["backend"],
+            "error": result["error"]
+        }
+        if run_log:
+            run_log.write(json.dumps(record) + "\n")
+        if journal:
+            # Cancelled files go back to planned so a resume converts them
+            state = "done" if result["success"] else "planned" if result["label"] == "Cancelled" else "failed"
+            journal.record(input_file, state, result["error"])
+        if result["label"] == "Deduplicated":
+            dedup_stats["files"] += 1
+            dedup_stats["bytes"] += result["input_bytes"]
+            dedup_stats["cpu_time"] = add_cpu_time(dedup_stats["cpu_time"], result["cpu_saved"])
+        elif result["success"] and result["label"] != "Cached":
+            timing_records.append(record)
+            record_throughput(spec, source_format, result["input_bytes"], result["exec_time"],
+                              file_pixels.get(input_file, 0), result["backend"])
+            record_output_ratio(spec, source_format, result["input_bytes"], result["output_bytes"])
+        # Process-wide counters served at /metrics
+        record_result(source_format, record["target_format"], result,
+                      result["success"] and result["label"] not in ("Cached", "Deduplicated"))
+        file_pixels.pop(input_file, None)
+        total_label = run.total if run.scan_complete else f"{run.total}+"
+        line = format_result_line(processed, total_label, result)
+
+        # Streaming deletion keeps extra disk use to the outputs in flight
+        if streaming_delete and result["success"]:
+            delete_error = delete_original(spec, input_file)
+            if delete_error:
+                line += f"Failed to delete {os.path.basename(input_file)}: {delete_error}\n"
             else:
-                error_message = result.stderr.strip() if result.stderr else "Unknown error occurred"
-                conversion_results.append((input_file, False, error_message))
-                status_message += f"[{i}/{FILES_PROCESS_TOTAL}] Failed: {os.path.basename(input_file)} - {error_message}\n"
-                
-        except subprocess.TimeoutExpired:
-            conversion_results.append((input_file, False, "Conversion timeout"))
-            status_message += f"[{i}/{FILES_PROCESS_TOTAL}] Timeout: {os.path.basename(input_file)}\n"
-        except Exception as e:
-            conversion_results.append((input_file, False, str(e)))
-            status_message += f"[{i}/{FILES_PROCESS_TOTAL}] Error: {os.path.basename(input_file)} - {str(e)}\n"
+                deleted_count += 1
+                if journal:
+                    journal.record(input_file, "deleted")
+        return line
+
+    def finish_primary(result):
+        """Finish a file and any duplicates waiting for it, returning their log lines."""
+        lines = [finish(result)]
+        if spec.deduplicate:
+            input_file = result["input_file"]
+            finished_primaries[input_file] = {"success": result["success"], "cpu_time": result["cpu_time"]}
+            for duplicate in waiting_duplicates.pop(input_file, []):
+                lines.append(finish(link_duplicate(spec, duplicate, input_file, finished_primaries[input_file])))
+        return lines
+
+    def on_batch_done(future):
+        """Free a finished batch's process slot at once, and wake the loop to collect its results."""
+        SHARED_SCHEDULER.release(run)
+        run.wakeup.set()
+
+    scheduler = ConversionScheduler(spec)
+    in_flight = set()
+    in_flight_memory = {}
+    in_flight_output = {}
+    disk_paused = False
+    try:
+        if spec.engine == "Asyncio":
+            executor, convert = AsyncioExecutor(worker_count), convert_files_async
+        else:
+            executor, convert = ThreadPoolExecutor(max_workers=worker_count), convert_files
+        with executor:
+            while True:
+                # On cancel, stop scanning and drop queued work; in-flight runs end quickly
+                cancelled = run.cancelled.is_set()
+                if cancelled:
+                    stop_event.set()
+                    scheduler.clear()
+
+                # Pull newly discovered files, blocking briefly only when idle
+                idle = not in_flight and not scheduler.ready
+                while not run.scan_complete and not cancelled:
+                    try:
+                        item = file_queue.get(timeout=0.1) if idle else file_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    idle = False
+                    if item is None:
+                        run.scan_complete = True
+                        break
+                    input_file, source_format, up_to_date, input_bytes, header, duplicate_of = item
+                    if up_to_date:
+                        skipped_count += 1
+                        continue
+                    run.total += 1
+                    queued_at[input_file] = time.monotonic()
+                    file_formats[input_file] = source_format
+                    if journal:
+                        journal.record(input_file, "planned")
+                    output_files = get_output_files(spec, input_file)
+                    clash = None
+                    for output_file in output_files:
+                        if output_file == input_file or output_file in claimed_outputs:
+                            clash = (output_file, claimed_outputs.get(output_file, input_file))
+                            break
+                    if clash:
+                        yield from finish_primary(make_result(spec, input_file, False, f"Output {os.path.basename(clash[0])} "
+                                                              f"would overwrite {os.path.basename(clash[1])}", "Failed"))
+                        continue
+                    for output_file in output_files:
+                        claimed_outputs[output_file] = input_file
+                    if duplicate_of:
+                        if duplicate_of in finished_primaries:
+                            yield finish(link_duplicate(spec, input_file, duplicate_of, finished_primaries[duplicate_of]))
+                        else:
+                            waiting_duplicates.setdefault(duplicate_of, []).append(input_file)
+                        continue
+                    if header:
+                        file_pixels[input_file] = header[0] * header[1]
+                    scheduler.add(input_file, input_bytes, header, source_format)
+                    # Largest-first ordering needs a wide view of pending work
+                    if scheduler.largest_first:
+                        if scheduler.pending_files >= SCHEDULER_WINDOW:
+                            break
+                    elif len(scheduler.ready) >= worker_count:
+                        break
+
+                # Partial batches go out once the scan ends or a worker would sit idle
+                if run.scan_complete or len(in_flight) + len(scheduler.ready) < worker_count:
+                    scheduler.flush()
+
+                # Admit work while a shared process slot is free and this job is owed it, and its
+                # estimated decode memory fits; an idle pool always takes one
+                waiting_for_slot = False
+                SHARED_SCHEDULER.set_waiting(run, bool(scheduler.ready) and len(in_flight) < worker_count)
+                while scheduler.ready and len(in_flight) < worker_count:
+                    if not SHARED_SCHEDULER.acquire(run):
+                        waiting_for_slot = True
+                        break
+                    memory_limit = get_memory_headroom(spec, sum(in_flight_memory.values())) if in_flight else None
+                    disk_limit = get_disk_headroom(spec, sum(in_flight_output.values())) if spec.disk_reserve_mb > 0 else None
+                    batch = scheduler.pop(memory_limit, disk_limit)
+                    if batch is None:
+                        # Held back by memory or free space; other jobs may use the slot meanwhile
+                        SHARED_SCHEDULER.set_waiting(run, False)
+                        SHARED_SCHEDULER.release(run)
+                        break
+                    SHARED_SCHEDULER.charge(run, len(batch[0]))
+                    now = time.monotonic()
+                    run.dispatched += len(batch[0])
+                    run.queue_wait += sum(now - queued_at.get(input_file, now) for input_file in batch[0])
+                    future = executor.submit(convert, run, batch[0], batch[3])
+                    future.add_done_callback(on_batch_done)
+                    in_flight.add(future)
+                    in_flight_memory[future] = batch[1]
+                    in_flight_output[future] = batch[2]
+                    if journal:
+                        for input_file in batch[0]:
+                            journal.record(input_file, "in_flight")
+
+                SHARED_SCHEDULER.set_waiting(run, waiting_for_slot)
+                run.queued = scheduler.pending_files
+                if journal:
+                    journal.flush()
+
+                # With nothing running and slots to spare, work is only held back by free space; wait for it
+                if not in_flight and scheduler.ready and not cancelled and not waiting_for_slot:
+                    if not disk_paused:
+                        disk_paused = True
+                        yield (f"Paused: projected output would leave less than {spec.disk_reserve_mb} MB free "
+                               f"in {spec.folder_location}; waiting for space...\n")
+                    run.cancelled.wait(DISK_RECHECK_INTERVAL)
+                    continue
+                if disk_paused and in_flight:
+                    disk_paused = False
+                    yield "Resumed: enough free space for the next files.\n"
+
+                if not in_flight:
+                    if (run.scan_complete or cancelled) and not scheduler.ready:
+                        break
+                    if waiting_for_slot:
+                        run.wakeup.wait(0.1)
+                        run.wakeup.clear()
+                    continue
 
-    # Delete original files if requested
-    if DELETE_FILES_AFTER:
-        deleted_count = 0
+                # Results are collected in completion order; counters are only touched here
+                run.wakeup.wait(0.1)
+                run.wakeup.clear()
+                done = {future for future in in_flight if future.done()}
+                in_flight -= done
+                for future in done:
+                    in_flight_memory.pop(future, None)
+                    in_flight_output.pop(future, None)
+                    for result in future.result():
+                        yield from finish_primary(result)
+
+            # Duplicates whose primary never finished, e.g. after a cancel, still get a result
+            for primary_file, duplicates in list(waiting_duplicates.items()):
+                for duplicate in duplicates:
+                    if run.cancelled.is_set():
+                        yield finish(make_result(spec, duplicate, False, "Cancelled", "Cancelled"))
+                    else:
+                        yield finish(make_result(spec, duplicate, False, f"Identical to "
+                                                 f"{os.path.basename(primary_file)}, which was not converted", "Failed"))
+            waiting_duplicates.clear()
+    finally:
+        stop_event.set()
+        run.queued = 0
+        SHARED_SCHEDULER.leave(run)
+        save_format_stats()
+        if run_log:
+            run_log.flush()
+        if journal:
+            journal.flush(force=True)
+    run_state = "cancelled" if run.cancelled.is_set() else "completed"
+
+    if run.cancelled.is_set():
+        not_started = run.total - processed
+        yield f"Conversion cancelled; {not_started} discovered files were not started.\n"
+
+    # A resumed run may still owe deletions for files it converted before the interruption
+    resumed_deletions = spec.delete_files_after and "done" in completed.values()
+    if not run.total and not resumed_deletions:
+        source_label = ", ".join(spec.format_from)
+        if skipped_count:
+            yield f"All {skipped_count} {source_label} files in {spec.folder_location} are already up to date.\n"
+        else:
+            yield f"No {source_label} files found in {spec.folder_location}.\n"
+        if run_log:
+            run_log.close()
+        if journal:
+            journal.finish_run(run_state)
+            journal.close()
+        return
+    if skipped_count:
+        yield f"Skipped {skipped_count} files that are already up to date.\n"
+
+    # Remember fingerprints of fresh outputs before any originals are removed
+    if spec.incremental_mode == "Fingerprint":
+        fingerprint_updates = {}
         for input_file, success, _ in conversion_results:
-            if success:
+            if not success:
+                continue
+            for output_file in get_output_files(spec, input_file):
                 try:
-                    os.remove(input_file)
-                    deleted_count += 1
-                except Exception as e:
-                    status_message += f"Failed to delete {os.path.basename(input_file)}: {str(e)}\n"
+                    fingerprint_updates[output_file] = get_fingerprint(input_file, output_file)
+                except OSError:
+                    fingerprint_updates[output_file] = None
+        save_fingerprints(fingerprint_updates)
+
+    # Delete remaining originals if requested, including those a resumed run converted earlier
+    if spec.delete_files_after:
+        converted_files = [input_file for input_file, state in completed.items() if state == "done"]
+        if not streaming_delete:
+            converted_files += [input_file for input_file, success, _ in conversion_results if success]
+        for input_file in converted_files:
+            delete_error = delete_original(spec, input_file)
+            if delete_error:
+                yield f"Failed to delete {os.path.basename(input_file)}: {delete_error}\n"
+                continue
+            deleted_count += 1
+            if journal:
+                journal.record(input_file, "deleted")
+                journal.flush()
         
         if deleted_count > 0:
-            status_message += f"Deleted {deleted_count} original files.\n"
+            yield f"Deleted {deleted_count} original files.\n"
 
     # Final summary
-    failed_count = FILES_PROCESS_TOTAL - FILES_PROCESS_DONE
-    status_message += f"\n=== CONVERSION SUMMARY ===\n"
-    status_message += f"Total files processed: {FILES_PROCESS_TOTAL}\n"
-    status_message += f"Successfully converted: {FILES_PROCESS_DONE}\n"
-    status_message += f"Failed conversions: {failed_count}\n"
+    yield f"\n=== CONVERSION SUMMARY ===\n"
+    yield f"Total files processed: {run.total}\n"
+    yield f"Successfully converted: {run.done}\n"
+    yield f"Failed conversions: {run.failed}\n"
+    if spec.incremental_mode != "Off":
+        yield f"Skipped (up to date): {skipped_count}\n"
+    if spec.deduplicate:
+        yield (f"Deduplicated: {dedup_stats['files']} files, saving {dedup_stats['bytes'] / 1048576:.1f} MB of input"
+               + (f" and {dedup_stats['cpu_time']:.1f} CPU-seconds" if dedup_stats["cpu_time"] is not None else "")
+               + "\n")
+    cache_summary = None
+    if spec.use_cache:
+        # Hits and misses are this run's; the cache itself is shared with every run
+        lookups = run.cache_stats["hits"] + run.cache_stats["misses"]
+        cache_summary = dict(run.cache_stats, bytes=get_cache_summary()["bytes"],
+                             hit_ratio=run.cache_stats["hits"] / lookups if lookups else 0.0)
+        yield (f"Cache: {cache_summary['hits']} hits, {cache_summary['misses']} misses "
+               f"({cache_summary['hit_ratio']:.0%} hit ratio), {cache_summary['stored']} stored, "
+               f"{cache_summary['bytes'] / 1048576:.1f} MB cached\n")
+
+    # Latency percentiles of successful conversions per format pair
+    latency_summary = summarize_latencies(timing_records)
+    for pair, stats in latency_summary.items():
+        yield (f"Latency {pair}: p50 {stats['p50']:.2f}s, p95 {stats['p95']:.2f}s, "
+               f"p99 {stats['p99']:.2f}s ({stats['count']} files)\n")
+    if run_log:
+        run_log.write(json.dumps({"summary": {
+            "total": run.total,
+            "converted": run.done,
+            "failed": run.failed,
+            "skipped": skipped_count,
+            "deduplicated": dedup_stats,
+            "cache": cache_summary,
+            "latency": latency_summary
+        }}) + "\n")
+        run_log.close()
+    if journal:
+        journal.finish_run(run_state)
+        journal.close()
 
-    return status_message
+def start_conversion(spec):
+    """Execute a conversion of spec and return the full log as one string."""
+    return "".join(iter_conversion(ConversionRun(spec)))